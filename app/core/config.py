@@ -0,0 +1,91 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class Settings:
+    """
+    Runtime settings read from the environment (or a local .env file).
+    """
+
+    def __init__(self):
+        # Outbound fan-out: every connection gets a bounded send queue drained
+        # by its own writer task. When the queue is full the overflow policy
+        # decides what happens: "drop-oldest", "coalesce" or "disconnect".
+        self.send_queue_size = int(os.environ.get("SEND_QUEUE_SIZE", 256))
+        self.send_overflow_policy = os.environ.get("SEND_OVERFLOW_POLICY", "drop-oldest")
+        self.send_timeout = float(os.environ.get("SEND_TIMEOUT", 10.0))
+
+        # Connection reaping. Every REAP_INTERVAL seconds connections whose
+        # writer died are torn down, as are connections that sent nothing
+        # (not even a {"type": "ping"}) for IDLE_TIMEOUT seconds; 0 disables
+        # the idle check, leaving dead TCP peers to the server's ping/pong.
+        self.reap_interval = float(os.environ.get("REAP_INTERVAL", 30.0))
+        self.idle_timeout = float(os.environ.get("IDLE_TIMEOUT", 0))
+
+        # Admission control. ROOM_CAPACITY caps students per room and
+        # NODE_CAPACITY caps connections on this worker (0 = no limit); joins
+        # over either limit are closed with 1013 before any room state is set up.
+        # A join takes its slot before checking it, so concurrent joins can't overshoot.
+        self.room_capacity = int(os.environ.get("ROOM_CAPACITY", 0))
+        self.node_capacity = int(os.environ.get("NODE_CAPACITY", 0))
+
+        # Inbound limits. Each connection gets a token bucket of MESSAGE_RATE
+        # messages/s (bursts up to MESSAGE_BURST) and each room one of
+        # ROOM_EVENT_RATE relayed student events/s; 0 disables a bucket.
+        # RATE_LIMIT_POLICY decides what happens to messages over the limit:
+        # "drop", "coalesce" (keep only the latest and handle it once a token
+        # frees up) or "close" (close the connection with 1008). Frames larger
+        # than MAX_FRAME_BYTES go through the same policy: dropped, or closed
+        # with 1009 under "close". WS_MAX_SIZE is the hard ceiling above that:
+        # start uvicorn with --ws-max-size WS_MAX_SIZE and it closes (1009)
+        # frames that big before they are read into memory.
+        self.message_rate = float(os.environ.get("MESSAGE_RATE", 20))
+        self.message_burst = float(os.environ.get("MESSAGE_BURST", 40))
+        self.room_event_rate = float(os.environ.get("ROOM_EVENT_RATE", 0))
+        self.room_event_burst = float(os.environ.get("ROOM_EVENT_BURST", 0))
+        self.rate_limit_policy = os.environ.get("RATE_LIMIT_POLICY", "drop")
+        self.max_frame_bytes = int(os.environ.get("MAX_FRAME_BYTES", 256 * 1024))
+        self.ws_max_size = max(self.max_frame_bytes, int(os.environ.get("WS_MAX_SIZE", 4 * self.max_frame_bytes)))
+
+        # Room-level aggregation of student events. When > 0, student state
+        # events are folded into one `room_snapshot` delta per room every
+        # interval instead of being relayed to teachers one by one.
+        self.room_aggregation_interval_ms = int(os.environ.get("ROOM_AGGREGATION_INTERVAL_MS", 0))
+
+        # Room state/broadcast backplane. "memory://" keeps everything in this
+        # process; a redis:// (or unix://) URL shares rooms across workers.
+        self.broker_url = os.environ.get("BROKER_URL", "memory://")
+
+        # Temporal smoothing of server-scored `features` messages: labels are
+        # voted over a window of frames and the score is an EMA.
+        self.feedback_window = int(os.environ.get("FEEDBACK_WINDOW", 15))
+        self.feedback_ema_alpha = float(os.environ.get("FEEDBACK_EMA_ALPHA", 0.2))
+
+        # Session analytics store (SQLite, write-behind), off unless
+        # ANALYTICS_DB_PATH is set. It records every relayed student event and
+        # never prunes, so point it at a persistent disk with room to grow.
+        self.analytics_db_path = os.environ.get("ANALYTICS_DB_PATH", "")
+        self.analytics_batch_size = int(os.environ.get("ANALYTICS_BATCH_SIZE", 2000))
+        self.analytics_flush_interval = float(os.environ.get("ANALYTICS_FLUSH_INTERVAL", 0.5))
+        self.analytics_max_buffer = int(os.environ.get("ANALYTICS_MAX_BUFFER", 200000))
+
+        # Server-side frame ingestion: students may upload JPEG frames as binary
+        # messages which are analysed in a CPU process pool (needs OpenCV and
+        # mediapipe, see requirements-vision.txt). Frame rates are throttled
+        # between the min and max fps.
+        self.frame_ingestion = os.environ.get("FRAME_INGESTION", "false").lower() in ("1", "true", "yes")
+        self.frame_workers = int(os.environ.get("FRAME_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+        self.frame_max_fps = float(os.environ.get("FRAME_MAX_FPS", 5.0))
+        self.frame_min_fps = float(os.environ.get("FRAME_MIN_FPS", 0.5))
+        self.frame_max_side = int(os.environ.get("FRAME_MAX_SIDE", 480))
+
+        # Logging. Per-message receive logs are DEBUG and capped at
+        # LOG_MESSAGE_RATE lines per second per process (0 disables them).
+        self.log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+        self.log_message_rate = float(os.environ.get("LOG_MESSAGE_RATE", 10))
+
+
+settings = Settings()
@@ -0,0 +1,33 @@
+import logging
+
+from app.utils.rate_limit import TokenBucket
+
+
+class RateLimitedLogger:
+    """
+    Wraps a logger for hot paths: at most `rate` records per second are
+    emitted, the rest are counted and reported as `suppressed` on the next
+    emitted record. Arguments are only formatted for records that are emitted,
+    and the check is skipped entirely when the level is disabled.
+    """
+
+    def __init__(self, logger: logging.Logger, rate: float, level: int = logging.DEBUG):
+        self.logger = logger
+        self.level = level
+        self.rate = rate
+        self.bucket = TokenBucket(rate) if rate > 0 else None
+        self.suppressed = 0
+
+    def log(self, msg: str, *args):
+        if self.bucket is None or not self.logger.isEnabledFor(self.level):
+            return
+
+        if not self.bucket.allow():
+            self.suppressed += 1
+            return
+
+        if self.suppressed:
+            msg += " (%d suppressed)"
+            args += (self.suppressed,)
+            self.suppressed = 0
+        self.logger.log(self.level, msg, *args)
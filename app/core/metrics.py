@@ -0,0 +1,149 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+LabelValues = Tuple[str, ...]
+Collected = Union[float, Dict[LabelValues, float]]
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    Minimal Prometheus-style metric. Label values are passed positionally and
+    stored in a plain dict keyed by the value tuple, so recording is a dict
+    update with no allocation beyond the key.
+    `collect`, if given, is called at scrape time instead of storing values;
+    it returns a number (unlabelled) or a {label values: number} dict.
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), collect: Optional[Callable[[], Collected]] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.collect = collect
+        self._values: Dict[LabelValues, float] = {}
+
+    def remove(self, *labels: str):
+        """Forget one label set (e.g. a closed room) so series don't accumulate forever."""
+        self._values.pop(labels, None)
+
+    def samples(self) -> Dict[LabelValues, float]:
+        if self.collect is None:
+            return self._values
+        collected = self.collect()
+        if isinstance(collected, dict):
+            return collected
+        return {(): collected}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for labels, value in list(self.samples().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, *labels: str, value: float):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def remove(self, *labels: str):
+        self._series.pop(labels, None)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for labels, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = (), collect=None) -> Counter:
+        return self.register(Counter(name, help, labelnames, collect))
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = (), collect=None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, collect))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Hot-path metrics shared across modules. Gauges and counters that mirror
+# state owned elsewhere (queue depths, connection counts) are registered with
+# a `collect` callback where that state lives and cost nothing until scraped.
+MESSAGES_RECEIVED = registry.counter("lf_messages_received_total", "WebSocket messages received", ("role",))
+BYTES_IN = registry.counter("lf_bytes_in_total", "Bytes received from clients", ("room",))
+BYTES_OUT = registry.counter("lf_bytes_out_total", "Bytes queued for sending to clients", ("room",))
+RELAY_LATENCY = registry.histogram("lf_relay_latency_seconds", "Time from receiving a student message to handing it to the teachers' queues")
+CONNECTIONS_CLOSED = registry.counter("lf_connections_closed_total", "Connections closed by the server", ("reason",))
+ADMISSION_REJECTED = registry.counter("lf_admission_rejected_total", "Joins rejected by capacity limits", ("reason",))
+RATE_LIMITED = registry.counter("lf_rate_limited_total", "Inbound messages over a rate limit", ("scope", "action"))
+OVERSIZED_FRAMES = registry.counter("lf_oversized_frames_total", "Inbound frames over MAX_FRAME_BYTES", ("action",))
+SEND_FAILURES = registry.counter("lf_send_failures_total", "Outbound messages that were not delivered", ("reason",))
@@ -1,16 +1,55 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, Set
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Union
+import asyncio
 import json
 from datetime import datetime
 import logging
 import os
+import time
+
+from app.core.config import settings
+from app.core.logging import RateLimitedLogger
+from app.core.metrics import (
+    ADMISSION_REJECTED, BYTES_IN, BYTES_OUT, CONNECTIONS_CLOSED, MESSAGES_RECEIVED, OVERSIZED_FRAMES,
+    PROMETHEUS_CONTENT_TYPE, RATE_LIMITED, RELAY_LATENCY, registry,
+)
+from app.ml.landmarks import require_face_mesh
+from app.services.aggregator import RoomAggregator
+from app.services.broker import Broker, InMemoryBroker, create_broker
+from app.services.connections import (
+    FRAME_TOO_LARGE_CLOSE_CODE, IDLE_CLOSE_CODE, POLICY_VIOLATION_CLOSE_CODE, REPLACED_CLOSE_CODE,
+    TRY_AGAIN_LATER_CLOSE_CODE, ConnectionRecord, ConnectionRegistry,
+)
+from app.services.feedback_generator import FeedbackEngine
+from app.services.ingestion import FrameIngestor
+from app.services.room_stats import RoomStats
+from app.storage.export import EXPORT_FORMATS, export_chunks
+from app.storage.repository import EVENT_COLUMNS, SERIES_COLUMNS, EventRepository, now_ms
+from app.utils.binary_protocol import decode_student_frame, encode_binary, negotiate
+from app.utils.image_utils import is_jpeg, require_cv2
+from app.utils.rate_limit import RATE_LIMIT_POLICIES, TokenBucket
+from app.utils.websocket_utils import OutboundChannel, encode_message, payload_size, with_timestamps
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=settings.log_level)
 logger = logging.getLogger(__name__)
+message_log = RateLimitedLogger(logger, settings.log_message_rate)
 
-app = FastAPI(title="Live Feedback System API")
+# Student state events relayed to teachers as they are
+STATE_EVENTS = ("drowsy", "looking_away", "distracted", "engaged", "alert")
+# Student messages that fan out to the room and count against its rate limit
+RELAYED_TYPES = STATE_EVENTS + ("features",)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await manager.start()
+    yield
+    await manager.stop()
+
+app = FastAPI(title="Live Feedback System API", lifespan=lifespan)
 
 # CORS Configuration
 app.add_middleware(
@@ -29,105 +68,543 @@ app.add_middleware(
 
 # Connection Manager
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, Dict[str, Set[WebSocket]]] = {}
-        self.students_metadata: Dict[str, Dict[str, dict]] = {}
+    """
+    Tracks the sockets connected to this worker. Everything that must be seen by
+    other workers (participants, connection counts, broadcasts) goes through the
+    broker; with the default in-memory broker this is a single-process relay.
+    Local connections live in a ConnectionRegistry; per-room services are keyed
+    by room and torn down with the room's last connection.
+    """
+    def __init__(self, broker: Broker = None, repository: EventRepository = None):
+        if settings.rate_limit_policy not in RATE_LIMIT_POLICIES:
+            raise ValueError(f"Unknown rate limit policy: {settings.rate_limit_policy}")
+        self.broker = broker or create_broker(settings.broker_url)
+        self.repository = repository
+        if repository is None and settings.analytics_db_path:
+            self.repository = EventRepository(
+                settings.analytics_db_path,
+                batch_size=settings.analytics_batch_size,
+                flush_interval=settings.analytics_flush_interval,
+                max_buffer=settings.analytics_max_buffer,
+            )
+        self.registry = ConnectionRegistry()
+        self.aggregators: Dict[str, RoomAggregator] = {}
+        self.feedback_engines: Dict[str, FeedbackEngine] = {}
+        self.room_stats: Dict[str, RoomStats] = {}
+        self.room_buckets: Dict[str, TokenBucket] = {}
+        # room -> student_id -> numeric index, for binary-encoded connections
+        self.student_indices: Dict[str, Dict[str, int]] = {}
+        # room -> epoch ms the local session started
+        self.session_started: Dict[str, int] = {}
+        # joins holding a node slot that are not in the registry yet
+        self.joining = 0
+        self.ingestor: Optional[FrameIngestor] = None
+        if settings.frame_ingestion:
+            require_cv2()
+            require_face_mesh()
+            self.ingestor = FrameIngestor(
+                self.relay_features,
+                self.send_frame_rate,
+                max_workers=settings.frame_workers,
+                max_fps=settings.frame_max_fps,
+                min_fps=settings.frame_min_fps,
+                max_side=settings.frame_max_side,
+            )
+        self._reaper: Optional[asyncio.Task] = None
+        self._started = False
+    
+    async def start(self):
+        if not self._started:
+            self._started = True
+            await self.broker.start(self.deliver)
+            if self.repository:
+                await self.repository.start()
+            if settings.reap_interval > 0:
+                self._reaper = asyncio.create_task(self.reap_loop())
+    
+    async def stop(self):
+        if self._started:
+            self._started = False
+            if self._reaper:
+                self._reaper.cancel()
+                self._reaper = None
+            await self.broker.stop()
+            if self.ingestor:
+                self.ingestor.shutdown()
+            if self.repository:
+                for room_id, started_at in self.session_started.items():
+                    self.repository.record_session_end(room_id, started_at)
+                await self.repository.stop()
+    
+    def open_room(self, room_id: str):
+        """Set up a room's local services; the caller subscribes to its broadcasts."""
+        self.student_indices[room_id] = {}
+        self.room_stats[room_id] = RoomStats()
+        self.feedback_engines[room_id] = FeedbackEngine(
+            window=settings.feedback_window,
+            alpha=settings.feedback_ema_alpha,
+        )
+        if settings.room_event_rate > 0:
+            self.room_buckets[room_id] = TokenBucket(settings.room_event_rate, settings.room_event_burst)
         
-    async def connect(self, websocket: WebSocket, room_id: str, role: str, user_id: str = None, name: str = None):
-        await websocket.accept()
+        self.session_started[room_id] = now_ms()
+        if self.repository:
+            self.repository.record_session_start(room_id, self.session_started[room_id])
         
-        if room_id not in self.active_connections:
-            self.active_connections[room_id] = {"teacher": set(), "student": set()}
-            self.students_metadata[room_id] = {}
+        if settings.room_aggregation_interval_ms > 0:
+            aggregator = RoomAggregator(
+                room_id,
+                self.registry.room(room_id)["student"],
+                lambda message: self.broadcast_to_teachers(room_id, message),
+                interval=settings.room_aggregation_interval_ms / 1000,
+            )
+            aggregator.start()
+            self.aggregators[room_id] = aggregator
+    
+    def close_room(self, room_id: str):
+        self.student_indices.pop(room_id, None)
+        if room_id in self.aggregators:
+            self.aggregators.pop(room_id).stop()
+        self.feedback_engines.pop(room_id, None)
+        self.room_stats.pop(room_id, None)
+        self.room_buckets.pop(room_id, None)
+        BYTES_IN.remove(room_id)
+        BYTES_OUT.remove(room_id)
+        started_at = self.session_started.pop(room_id, None)
+        if self.repository and started_at is not None:
+            self.repository.record_session_end(room_id, started_at)
         
-        self.active_connections[room_id][role].add(websocket)
+    async def connect(self, websocket: WebSocket, room_id: str, role: str, user_id: str = None, name: str = None,
+                      encoding: str = "json", subprotocol: str = None) -> Optional[ConnectionRecord]:
+        """Register a new connection; returns None if admission control turned it away."""
+        await self.start()
+        # reconnects replace a connection and always pass
+        reserved, rejected = False, None
+        if self.registry.user(room_id, role, user_id) is None:
+            rejected = await self.reserve_slot(room_id, role)
+            reserved = rejected is None
         
-        if role == "student" and user_id:
-            self.students_metadata[room_id][user_id] = {
-                "name": name or f"Student {user_id}",
-                "connection": websocket,
-                "joined_at": datetime.now().isoformat(),
-                "status": "active"
-            }
+        try:
+            await websocket.accept(subprotocol=subprotocol)
+            if rejected:
+                ADMISSION_REJECTED.inc(rejected)
+                logger.warning(f"Rejected {role} {user_id or 'unknown'} in room {room_id}: {rejected}")
+                await self.close_socket(websocket, TRY_AGAIN_LATER_CLOSE_CODE, rejected.replace("_", " "))
+                return None
             
-            await self.broadcast_to_teachers(room_id, {
-                "type": "student_joined",
-                "student_id": user_id,
-                "name": name or f"Student {user_id}",
-                "timestamp": datetime.now().isoformat()
-            })
+            index = None
+            if role == "student" and user_id and self.registry.user(room_id, role, user_id) is None:
+                index = await self.broker.next_student_index(room_id)
+        except BaseException:
+            if reserved:
+                await self.release_slot(room_id, role)
+            raise
+        
+        # Nothing from here to registry.add awaits, so the last member leaving
+        # can't close the room between opening (or finding) it and joining it.
+        channel = OutboundChannel(
+            websocket,
+            maxsize=settings.send_queue_size,
+            policy=settings.send_overflow_policy,
+            send_timeout=settings.send_timeout,
+            encoding=encoding,
+        )
+        channel.start()
+        record = ConnectionRecord(websocket, room_id, role, user_id, channel)
+        if settings.message_rate > 0:
+            record.bucket = TokenBucket(settings.message_rate, settings.message_burst)
+        
+        opened = not self.registry.has_room(room_id)
+        if opened:
+            self.registry.room(room_id)
+            self.open_room(room_id)
+        
+        previous = self.registry.user(room_id, role, user_id)
+        if previous is not None and role == "student":
+            # a reconnect keeps the roster entry and the aggregator state
+            record.name = name or previous.name
+            record.index, record.joined_at, record.status = previous.index, previous.joined_at, previous.status
+            record.state, record.flushed_state = previous.state, previous.flushed_state
+        elif role == "student" and user_id:
+            record.name = name or f"Student {user_id}"
+            record.index = index
+            record.joined_at = datetime.now().isoformat()
+        
+        # swap both indexes in one step; the old socket is closed afterwards
+        replaced = self.registry.add(record)
+        if reserved:
+            self.joining -= 1
+        if role == "student" and user_id and replaced is None:
+            self.room_stats[room_id].student_joined(user_id, record.status)
+        
+        if opened:
+            await self.broker.subscribe(room_id)
+            if not self.registry.has_room(room_id):
+                # everyone left while subscribing and disconnect() may have unsubscribed first
+                await self.broker.unsubscribe(room_id)
+        
+        if replaced is not None:
+            CONNECTIONS_CLOSED.inc("replaced")
+            replaced.channel.close()
+            if replaced.pending_task:
+                replaced.pending_task.cancel()
+            asyncio.create_task(self.close_socket(replaced.websocket, REPLACED_CLOSE_CODE, "replaced by a new connection"))
+            logger.info(f"{role.capitalize()} {user_id} reconnected to room {room_id}, closing the previous connection")
+            if reserved:
+                # a reconnect of the same user got in first; its membership carries over
+                await self.broker.remove_member(room_id, role)
+        elif not reserved:
+            # the connection this reconnect was going to replace left in the meantime
+            await self.broker.add_member(room_id, role)
+        
+        if role == "student" and user_id:
+            await self.broker.add_student(room_id, user_id, record.info())
+            if replaced is None:
+                await self.broadcast_to_teachers(room_id, {
+                    "type": "student_joined",
+                    "student_id": user_id,
+                    "name": record.name,
+                    "index": record.index,
+                    "timestamp": datetime.now().isoformat()
+                })
         
         logger.info(f"{role.capitalize()} {user_id or 'unknown'} joined room {room_id}")
         
         if role == "teacher":
             await self.send_participants_list(websocket, room_id)
+            if room_id in self.aggregators:
+                self.send(websocket, self.aggregators[room_id].snapshot(), room_id=room_id)
+        return record
     
-    def disconnect(self, websocket: WebSocket, room_id: str, role: str, user_id: str = None):
-        if room_id in self.active_connections:
-            if websocket in self.active_connections[room_id][role]:
-                self.active_connections[room_id][role].remove(websocket)
-            
-            if role == "student" and user_id and room_id in self.students_metadata:
-                if user_id in self.students_metadata[room_id]:
-                    student_name = self.students_metadata[room_id][user_id]["name"]
-                    del self.students_metadata[room_id][user_id]
-                    
-                    import asyncio
-                    asyncio.create_task(self.broadcast_to_teachers(room_id, {
-                        "type": "student_left",
-                        "student_id": user_id,
-                        "name": student_name,
-                        "timestamp": datetime.now().isoformat()
-                    }))
-            
-            if not self.active_connections[room_id]["teacher"] and not self.active_connections[room_id]["student"]:
-                del self.active_connections[room_id]
-                if room_id in self.students_metadata:
-                    del self.students_metadata[room_id]
+    async def disconnect(self, websocket: WebSocket, close_code: Optional[int] = None, reason: str = ""):
+        """
+        Tear down everything held for a socket. Safe to call more than once and
+        for sockets that were already replaced by a reconnect.
+        """
+        record = self.registry.remove(websocket)
+        if record is None:
+            return
+        record.channel.close()
+        if record.pending_task:
+            record.pending_task.cancel()
+        room_id, role, user_id = record.room_id, record.role, record.user_id
+        # drop local state before awaiting so a concurrent join or reconnect starts afresh
+        if role == "student" and user_id:
+            if room_id in self.feedback_engines:
+                self.feedback_engines[room_id].remove(user_id)
+                self.room_stats[room_id].student_left(user_id)
+            if self.ingestor:
+                self.ingestor.remove(room_id, user_id)
+        room_closed = not self.registry.has_room(room_id)
+        if room_closed:
+            self.close_room(room_id)
+        
+        if close_code is not None:
+            await self.close_socket(websocket, close_code, reason)
+        await self.broker.remove_member(room_id, role)
+        
+        # the student may have reconnected while we were awaiting; then it never left
+        if role == "student" and user_id and self.registry.user(room_id, role, user_id) is None:
+            await self.broker.remove_student(room_id, user_id)
+            if self.registry.user(room_id, role, user_id) is None:
+                await self.broadcast_to_teachers(room_id, {
+                    "type": "student_left",
+                    "student_id": user_id,
+                    "name": record.name,
+                    "index": record.index,
+                    "timestamp": datetime.now().isoformat()
+                })
+        
+        if room_closed and not self.registry.has_room(room_id):
+            await self.broker.unsubscribe(room_id)
         
         logger.info(f"{role.capitalize()} {user_id or 'unknown'} left room {room_id}")
     
+    async def reserve_slot(self, room_id: str, role: str) -> Optional[str]:
+        """
+        Hold a node slot and a room membership for a new join, or return the
+        reason to turn it away. Slots are taken before they are checked, so
+        concurrent joins can't both get the last one; release_slot() gives
+        them back if the join fails before it is registered.
+        """
+        if settings.node_capacity and len(self.registry) + self.joining >= settings.node_capacity:
+            return "node_full"
+        self.joining += 1
+        limit = settings.room_capacity if settings.room_capacity and role == "student" else None
+        try:
+            admitted = await self.broker.add_member(room_id, role, limit)
+        except BaseException:
+            self.joining -= 1
+            raise
+        if not admitted:
+            self.joining -= 1
+            return "room_full"
+        return None
+    
+    async def release_slot(self, room_id: str, role: str):
+        self.joining -= 1
+        await self.broker.remove_member(room_id, role)
+    
+    def limit(self, record: ConnectionRecord, message: Optional[dict]) -> Optional[str]:
+        """
+        Take tokens for an inbound message. Returns the limit that holds it
+        back ("connection" or "room"), or None if it can be handled now.
+        Relayed student events also draw from the room's bucket.
+        """
+        if record.pending is not None:
+            # keep order: nothing overtakes a coalesced message
+            return "connection"
+        if record.bucket is not None and not record.bucket.allow():
+            return "connection"
+        if message is not None and record.role == "student" and message.get("type") in RELAYED_TYPES:
+            bucket = self.room_buckets.get(record.room_id)
+            if bucket is not None and not bucket.allow():
+                return "room"
+        return None
+    
+    async def throttle(self, record: ConnectionRecord, message: Optional[dict], scope: str, handler) -> bool:
+        """
+        Apply the rate limit policy to a message held back by `limit`.
+        Returns True if the connection was closed. A room-wide limit never
+        closes an individual student, and frames (message=None) are never coalesced.
+        """
+        policy = settings.rate_limit_policy
+        if policy == "close" and scope == "connection":
+            RATE_LIMITED.inc(scope, "closed")
+            logger.warning(f"Closing {record.role} {record.user_id} in room {record.room_id}: rate limit exceeded")
+            await self.disconnect(record.websocket, POLICY_VIOLATION_CLOSE_CODE, "rate limit exceeded")
+            return True
+        
+        if policy == "coalesce" and message is not None:
+            RATE_LIMITED.inc(scope, "coalesced")
+            record.pending = message
+            if record.pending_task is None:
+                record.pending_task = asyncio.create_task(self.handle_pending(record, handler))
+            return False
+        
+        RATE_LIMITED.inc(scope, "dropped")
+        return False
+    
+    async def handle_pending(self, record: ConnectionRecord, handler):
+        """Hand the latest coalesced message to `handler` once the limits allow it."""
+        try:
+            while record.pending is not None:
+                delays = [record.bucket.delay() if record.bucket else 0.0]
+                if record.room_id in self.room_buckets:
+                    delays.append(self.room_buckets[record.room_id].delay())
+                await asyncio.sleep(max(delays))
+                if self.registry.get(record.websocket) is not record:
+                    return
+                
+                message, record.pending = record.pending, None
+                if self.limit(record, message):
+                    record.pending = message
+                    continue
+                await handler(record, message, time.perf_counter())
+        except Exception as e:
+            logger.error(f"Error handling coalesced message from {record.user_id}: {e}")
+        finally:
+            record.pending_task = None
+    
+    async def reject_oversized(self, record: ConnectionRecord, size: int) -> bool:
+        """Drop a frame over MAX_FRAME_BYTES, or close the connection under the close policy."""
+        if settings.rate_limit_policy == "close":
+            OVERSIZED_FRAMES.inc("closed")
+            logger.warning(f"Closing {record.role} {record.user_id} in room {record.room_id}: {size} byte frame")
+            await self.disconnect(record.websocket, FRAME_TOO_LARGE_CLOSE_CODE, "frame too large")
+            return True
+        OVERSIZED_FRAMES.inc("dropped")
+        return False
+    
+    @staticmethod
+    async def close_socket(websocket: WebSocket, code: int, reason: str):
+        try:
+            await websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+    
+    async def reap(self, now: Optional[float] = None):
+        """Disconnect connections whose writer died or that have been idle too long."""
+        now = time.monotonic() if now is None else now
+        cutoff = now - settings.idle_timeout if settings.idle_timeout > 0 else float("-inf")
+        for record in self.registry.idle(cutoff):
+            reason = "send_failed" if record.channel.closed else "idle"
+            CONNECTIONS_CLOSED.inc(reason)
+            logger.info(f"Reaping {record.role} {record.user_id} in room {record.room_id} ({reason})")
+            await self.disconnect(record.websocket, IDLE_CLOSE_CODE, reason)
+    
+    async def reap_loop(self):
+        while True:
+            await asyncio.sleep(settings.reap_interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error(f"Error reaping connections: {e}")
+    
     async def send_participants_list(self, websocket: WebSocket, room_id: str):
-        if room_id in self.students_metadata:
-            participants = [
-                {
-                    "student_id": sid,
-                    "name": info["name"],
-                    "joined_at": info["joined_at"],
-                    "status": info["status"]
-                }
-                for sid, info in self.students_metadata[room_id].items()
-            ]
+        students = await self.broker.get_students(room_id)
+        participants = [
+            {
+                "student_id": sid,
+                "name": info["name"],
+                "index": info["index"],
+                "joined_at": info["joined_at"],
+                "status": info["status"]
+            }
+            for sid, info in students.items()
+        ]
+        if room_id in self.student_indices:
+            self.student_indices[room_id].update((p["student_id"], p["index"]) for p in participants)
+        
+        self.send(websocket, {
+            "type": "participants_list",
+            "participants": participants,
+            "count": len(participants)
+        }, room_id=room_id)
+    
+    async def update_student_status(self, room_id: str, student_id: str, status: str):
+        record = self.registry.user(room_id, "student", student_id)
+        if record is not None:
+            record.status = status
+            self.room_stats[room_id].set_status(student_id, status)
+            await self.broker.update_student(room_id, student_id, status=status)
+    
+    def encode(self, room_id: str, message: dict, encoding: str) -> Union[str, bytes]:
+        if encoding == "binary":
+            payload = encode_binary(message, self.student_indices.get(room_id, {}).get)
+            if payload is not None:
+                return payload
+        return encode_message(with_timestamps(message))
+    
+    def send(self, websocket: WebSocket, message: dict, key: Optional[str] = None, room_id: str = None) -> bool:
+        record = self.registry.get(websocket)
+        if record is None:
+            return False
+        payload = self.encode(room_id, message, record.channel.encoding)
+        if not record.channel.send(payload, key):
+            return False
+        if room_id is not None:
+            BYTES_OUT.inc(room_id, amount=payload_size(payload))
+        return True
+    
+    async def broadcast_to_teachers(self, room_id: str, message: dict, key: Optional[str] = None):
+        await self.broker.publish(room_id, {"target": "teacher", "key": key, "message": message})
+    
+    async def relay_features(self, room_id: str, student_id: str, features: dict):
+        """
+        Score raw features on the server and relay a `feedback` event to teachers,
+        but only when the smoothed state of the student changes.
+        """
+        engine = self.feedback_engines.get(room_id)
+        student = self.registry.user(room_id, "student", student_id)
+        if engine is None or student is None:
+            return
+        
+        result = engine.update(student_id, features)
+        if result is None:
+            return
+        
+        await self.relay_student_event(room_id, student_id, {
+            "type": "feedback",
+            "student_id": student_id,
+            "student_name": student.name,
+            "feedback": result["feedback"],
+            "derived": result["derived"],
+            "ts": now_ms()
+        })
+    
+    async def send_frame_rate(self, room_id: str, student_id: str, fps: float):
+        """Tell a frame-uploading student how fast to send (always a local socket)."""
+        student = self.registry.user(room_id, "student", student_id)
+        if student is not None:
+            self.send(student.websocket, {"type": "frame_rate", "fps": fps}, room_id=room_id)
+    
+    async def send_to_student(self, room_id: str, student_id: str, message: dict):
+        await self.broker.publish(room_id, {"target": "student", "student_id": student_id, "message": message})
+    
+    async def deliver(self, room_id: str, envelope: dict):
+        """Broker callback: hand a published message to the matching local sockets."""
+        if envelope.get("target") == "teacher":
+            message = envelope["message"]
+            indices = self.student_indices.get(room_id)
+            if indices is not None and message.get("type") == "student_joined":
+                indices[message["student_id"]] = message["index"]
             
-            await websocket.send_json({
-                "type": "participants_list",
-                "participants": participants,
-                "count": len(participants)
-            })
-    
-    async def broadcast_to_teachers(self, room_id: str, message: dict):
-        if room_id in self.active_connections:
-            disconnected = set()
-            for connection in self.active_connections[room_id]["teacher"]:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    logger.error(f"Error sending to teacher: {e}")
-                    disconnected.add(connection)
+            self.fan_out_to_teachers(room_id, message, envelope.get("key"))
             
-            for conn in disconnected:
-                self.active_connections[room_id]["teacher"].discard(conn)
+            if indices is not None and message.get("type") == "student_left":
+                indices.pop(message["student_id"], None)
+        elif envelope.get("target") == "student":
+            student_id = envelope.get("student_id")
+            student = self.registry.user(room_id, "student", student_id)
+            if student is not None and not self.send(student.websocket, envelope["message"], room_id=room_id):
+                logger.error(f"Error sending to student {student_id}: connection closed")
     
-    async def send_to_student(self, room_id: str, student_id: str, message: dict):
-        if room_id in self.students_metadata and student_id in self.students_metadata[room_id]:
-            connection = self.students_metadata[room_id][student_id]["connection"]
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending to student {student_id}: {e}")
+    def fan_out_to_teachers(self, room_id: str, message: dict, key: Optional[str] = None):
+        """
+        Fan a message out to every local teacher in the room without awaiting any socket.
+        The payload is encoded once per wire encoding and handed to each connection's outbound queue;
+        `key` lets the coalesce overflow policy replace an older queued update.
+        Teachers whose channel has closed are left for the reaper to tear down.
+        """
+        teachers = self.registry.members(room_id, "teacher")
+        if not teachers:
+            return
+        
+        payloads = {}
+        sent_bytes = 0
+        for record in teachers.values():
+            channel = record.channel
+            encoded = payloads.get(channel.encoding)
+            if encoded is None:
+                payload = self.encode(room_id, message, channel.encoding)
+                encoded = payloads[channel.encoding] = (payload, payload_size(payload))
+            if channel.send(encoded[0], key):
+                sent_bytes += encoded[1]
+        
+        if sent_bytes:
+            BYTES_OUT.inc(room_id, amount=sent_bytes)
+    
+    def connection_counts(self) -> Dict[tuple, int]:
+        return {(role,): count for role, count in self.registry.counts.items()}
+    
+    def send_queue_depth(self) -> Dict[tuple, int]:
+        depths = [len(record.channel) for record in self.registry]
+        return {("total",): sum(depths), ("max",): max(depths, default=0)}
+    
+    async def relay_student_event(self, room_id: str, student_id: str, message: dict):
+        if self.repository:
+            self.repository.record_event(room_id, student_id, message, message.get("ts"))
+        if room_id in self.room_stats:
+            self.room_stats[room_id].record_event(student_id, message)
+        
+        aggregator = self.aggregators.get(room_id)
+        if aggregator is not None:
+            aggregator.update(student_id, message)
+        else:
+            await self.broadcast_to_teachers(room_id, message, key=student_id)
 
 manager = ConnectionManager()
 
+# Gauges over state the manager already keeps; evaluated only when scraped.
+registry.gauge("lf_connections", "WebSocket connections on this worker", ("role",), collect=manager.connection_counts)
+registry.gauge("lf_rooms", "Rooms with at least one local connection", collect=lambda: len(manager.registry.rooms))
+registry.gauge("lf_send_queue_depth", "Payloads waiting in outbound queues (sum and largest single queue)", ("stat",), collect=manager.send_queue_depth)
+registry.gauge("lf_analytics_pending", "Events buffered for the analytics store",
+               collect=lambda: manager.repository.pending if manager.repository else 0)
+registry.counter("lf_analytics_written_total", "Events written to the analytics store",
+                 collect=lambda: manager.repository.written if manager.repository else 0)
+registry.counter("lf_analytics_dropped_total", "Events dropped because the analytics buffer was full",
+                 collect=lambda: manager.repository.dropped if manager.repository else 0)
+registry.gauge("lf_frame_queue_depth", "Uploaded frames waiting or being processed",
+               collect=lambda: manager.ingestor.queue_depth if manager.ingestor else 0)
+registry.counter("lf_frames_total", "Uploaded frames by outcome", ("outcome",),
+                 collect=lambda: {
+                     ("processed",): manager.ingestor.processed,
+                     ("dropped",): manager.ingestor.dropped,
+                     ("failed",): manager.ingestor.failed,
+                 } if manager.ingestor else {})
+
 @app.get("/")
 async def root():
     return {
@@ -137,7 +614,9 @@ async def root():
         "endpoints": {
             "health": "/health",
             "websocket": "/ws/{room_id}/{role}/{user_id}",
-            "room_stats": "/rooms/{room_id}/stats"
+            "room_stats": "/rooms/{room_id}/stats",
+            "room_events": "/rooms/{room_id}/events",
+            "metrics": "/metrics"
         }
     }
 
@@ -148,28 +627,128 @@ async def health_check():
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of this worker's counters, gauges and histograms."""
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.get("/rooms/{room_id}/stats")
-async def get_room_stats(room_id: str):
-    if room_id not in manager.active_connections:
+async def get_room_stats(room_id: str, students: bool = True):
+    """
+    Room counts plus the incrementally maintained aggregates of the students
+    connected to this worker. With a shared broker those cover only this
+    worker's share of the room, so `stats` says so in `scope` along with the
+    number of students it covers. Pass students=false to skip the per-student
+    list, which is the only part of the response that grows with the class size.
+    """
+    counts = await manager.broker.get_counts(room_id)
+    if not any(counts.values()):
         return {
             "room_id": room_id,
             "exists": False
         }
     
-    return {
+    response = {
         "room_id": room_id,
         "exists": True,
-        "teachers_count": len(manager.active_connections[room_id]["teacher"]),
-        "students_count": len(manager.active_connections[room_id]["student"]),
-        "students": [
+        "teachers_count": counts["teacher"],
+        "students_count": counts["student"],
+    }
+    if room_id in manager.room_stats:
+        response["stats"] = {
+            "scope": "room" if isinstance(manager.broker, InMemoryBroker) else "worker",
+            "students_count": len(manager.registry.members(room_id, "student")),
+            **manager.room_stats[room_id].snapshot(),
+        }
+    if students:
+        response["students"] = [
             {
                 "student_id": sid,
                 "name": info["name"],
                 "joined_at": info["joined_at"]
             }
-            for sid, info in manager.students_metadata.get(room_id, {}).items()
+            for sid, info in (await manager.broker.get_students(room_id)).items()
         ]
-    }
+    return response
+
+@app.get("/rooms/{room_id}/events")
+async def export_room_events(
+    room_id: str,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    format: str = "ndjson",
+    points: Optional[int] = Query(None, ge=1, le=10000),
+):
+    """
+    Stream a room's stored events between `start` and `end` (epoch ms,
+    defaulting to the room's latest session) as NDJSON or CSV. With `points`,
+    each student's timeline is downsampled to at most that many buckets.
+    Rows are read in batches on a worker thread while the response is sent,
+    so memory stays flat however long the session was.
+    """
+    if manager.repository is None:
+        raise HTTPException(status_code=503, detail="Analytics store is disabled")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    
+    if start is None or end is None:
+        sessions = await manager.repository.room_sessions(room_id)
+        latest = sessions[-1] if sessions else {"started_at": 0, "ended_at": None}
+        start = latest["started_at"] if start is None else start
+        end = (latest["ended_at"] or now_ms() + 1) if end is None else end
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    
+    if points:
+        batches = manager.repository.iter_room_series(room_id, start, end, points)
+        columns = SERIES_COLUMNS
+    else:
+        batches = manager.repository.iter_room_events(room_id, start, end)
+        columns = EVENT_COLUMNS
+    
+    headers = {}
+    if format == "csv":
+        headers["Content-Disposition"] = f'attachment; filename="{room_id}-{start}-{end}.csv"'
+    # a sync iterator: Starlette pulls each chunk on the thread pool
+    return StreamingResponse(export_chunks(batches, columns, format), media_type=EXPORT_FORMATS[format], headers=headers)
+
+async def handle_message(record: ConnectionRecord, message: dict, received: float):
+    """Act on one decoded message from a connection that passed the rate limits."""
+    websocket, room_id, role, user_id = record.websocket, record.room_id, record.role, record.user_id
+    
+    if message.get("type") == "ping":
+        manager.send(websocket, {"type": "pong"}, room_id=room_id)
+    
+    elif role == "student":
+        if message.get("type") in STATE_EVENTS:
+            message["student_id"] = user_id
+            message["student_name"] = record.name or user_id
+            message["ts"] = now_ms()
+            # the server's clock is authoritative; JSON peers get it back as `timestamp`
+            message.pop("timestamp", None)
+            
+            await manager.relay_student_event(room_id, user_id, message)
+            RELAY_LATENCY.observe(time.perf_counter() - received)
+        
+        elif message.get("type") == "features":
+            await manager.relay_features(room_id, user_id, message.get("features") or {})
+            RELAY_LATENCY.observe(time.perf_counter() - received)
+        
+        elif message.get("type") == "status_update":
+            await manager.update_student_status(room_id, user_id, message.get("status", "active"))
+    
+    elif role == "teacher":
+        if message.get("type") == "request_participants":
+            await manager.send_participants_list(websocket, room_id)
+        
+        elif message.get("type") == "message_to_student":
+            target_student = message.get("student_id")
+            if target_student:
+                await manager.send_to_student(room_id, target_student, {
+                    "type": "teacher_message",
+                    "message": message.get("message", ""),
+                    "timestamp": datetime.now().isoformat()
+                })
 
 @app.websocket("/ws/{room_id}/{role}/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, room_id: str, role: str, user_id: str):
@@ -184,49 +763,60 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, role: str, user
     except:
         pass
     
-    await manager.connect(websocket, room_id, role, user_id, name)
-    
+    encoding, subprotocol = negotiate(websocket)
     try:
+        # inside the try so a join that fails halfway is still torn down
+        record = await manager.connect(websocket, room_id, role, user_id, name, encoding, subprotocol)
+        if record is None:
+            return
+        
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            data = await websocket.receive()
+            if data["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(data.get("code", 1000))
+            received = time.perf_counter()
+            record.last_seen = time.monotonic()
+            MESSAGES_RECEIVED.inc(role)
             
-            logger.info(f"Received from {role} {user_id}: {message.get('type', 'unknown')}")
+            raw = data["bytes"] if data.get("bytes") is not None else data["text"]
+            size = payload_size(raw)
+            BYTES_IN.inc(room_id, amount=size)
+            if size > settings.max_frame_bytes:
+                if await manager.reject_oversized(record, size):
+                    break
+                continue
             
-            if role == "student":
-                if message.get("type") in ["drowsy", "looking_away", "distracted", "engaged", "alert"]:
-                    message["student_id"] = user_id
-                    message["student_name"] = manager.students_metadata.get(room_id, {}).get(user_id, {}).get("name", user_id)
-                    message["timestamp"] = datetime.now().isoformat()
-                    
-                    await manager.broadcast_to_teachers(room_id, message)
-                
-                elif message.get("type") == "status_update":
-                    if room_id in manager.students_metadata and user_id in manager.students_metadata[room_id]:
-                        manager.students_metadata[room_id][user_id]["status"] = message.get("status", "active")
+            if isinstance(raw, bytes) and is_jpeg(raw):
+                limited = manager.limit(record, None)
+                if limited:
+                    if await manager.throttle(record, None, limited, handle_message):
+                        break
+                elif role == "student" and manager.ingestor:
+                    manager.ingestor.submit(room_id, user_id, raw)
+                continue
             
-            elif role == "teacher":
-                if message.get("type") == "request_participants":
-                    await manager.send_participants_list(websocket, room_id)
-                
-                elif message.get("type") == "message_to_student":
-                    target_student = message.get("student_id")
-                    if target_student:
-                        await manager.send_to_student(room_id, target_student, {
-                            "type": "teacher_message",
-                            "message": message.get("message", ""),
-                            "timestamp": datetime.now().isoformat()
-                        })
+            message = decode_student_frame(raw) if isinstance(raw, bytes) else json.loads(raw)
+            message_log.log("Received from %s %s: %s", role, user_id, message.get("type", "unknown"))
+            
+            limited = manager.limit(record, message)
+            if limited:
+                if await manager.throttle(record, message, limited, handle_message):
+                    break
+                continue
+            
+            await handle_message(record, message, received)
     
     except WebSocketDisconnect:
-        manager.disconnect(websocket, room_id, role, user_id)
         logger.info(f"{role.capitalize()} {user_id} disconnected from room {room_id}")
     
     except Exception as e:
         logger.error(f"Error in WebSocket connection: {e}")
-        manager.disconnect(websocket, room_id, role, user_id)
+    
+    finally:
+        await manager.disconnect(websocket)
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # refuse huge frames in the protocol layer instead of buffering up to the 16 MiB default
+    uvicorn.run(app, host="0.0.0.0", port=port, ws_max_size=settings.ws_max_size)
\ No newline at end of file
@@ -0,0 +1,43 @@
+from typing import Any, Dict
+
+import numpy as np
+
+# MediaPipe FaceMesh landmark indices (image-left / image-right)
+LEFT_EYE_TOP, LEFT_EYE_BOTTOM, LEFT_EYE_OUTER, LEFT_EYE_INNER = 159, 145, 33, 133
+RIGHT_EYE_TOP, RIGHT_EYE_BOTTOM, RIGHT_EYE_OUTER, RIGHT_EYE_INNER = 386, 374, 263, 362
+UPPER_LIP, LOWER_LIP, MOUTH_LEFT, MOUTH_RIGHT = 13, 14, 61, 291
+
+# eyelid gap / eye width above which an eye counts as open
+EYE_OPEN_RATIO = 0.18
+# lip gap / mouth width above which the mouth counts as open
+MOUTH_OPEN_RATIO = 0.35
+
+
+def _dist(landmarks: np.ndarray, a: int, b: int) -> float:
+    return float(np.linalg.norm(landmarks[a, :2] - landmarks[b, :2]))
+
+
+def expression_features(landmarks: np.ndarray) -> Dict[str, Any]:
+    """
+    Eye/mouth openness from normalized FaceMesh landmarks, in the same shape
+    the browser client sends (see score_attention):
+      leftEyeOpen, rightEyeOpen, mouthOpen, raw: {leftEyeDist, rightEyeDist, lipDist}
+    """
+    left = _dist(landmarks, LEFT_EYE_TOP, LEFT_EYE_BOTTOM)
+    right = _dist(landmarks, RIGHT_EYE_TOP, RIGHT_EYE_BOTTOM)
+    lip = _dist(landmarks, UPPER_LIP, LOWER_LIP)
+
+    left_width = _dist(landmarks, LEFT_EYE_OUTER, LEFT_EYE_INNER) or 1e-6
+    right_width = _dist(landmarks, RIGHT_EYE_OUTER, RIGHT_EYE_INNER) or 1e-6
+    mouth_width = _dist(landmarks, MOUTH_LEFT, MOUTH_RIGHT) or 1e-6
+
+    return {
+        "leftEyeOpen": left / left_width > EYE_OPEN_RATIO,
+        "rightEyeOpen": right / right_width > EYE_OPEN_RATIO,
+        "mouthOpen": lip / mouth_width > MOUTH_OPEN_RATIO,
+        "raw": {
+            "leftEyeDist": left,
+            "rightEyeDist": right,
+            "lipDist": lip,
+        },
+    }
@@ -0,0 +1,52 @@
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from app.ml.face_expression import (
+    LEFT_EYE_BOTTOM,
+    LEFT_EYE_INNER,
+    LEFT_EYE_OUTER,
+    LEFT_EYE_TOP,
+    RIGHT_EYE_BOTTOM,
+    RIGHT_EYE_INNER,
+    RIGHT_EYE_OUTER,
+    RIGHT_EYE_TOP,
+)
+
+# Iris centers, only present with refine_landmarks (478 points)
+LEFT_IRIS, RIGHT_IRIS = 468, 473
+
+# Horizontal iris position (0 = outer corner, 1 = inner corner) considered on-screen
+ON_SCREEN_RANGE = (0.35, 0.65)
+
+
+def _ratio(value: float, start: float, end: float) -> float:
+    span = end - start
+    if abs(span) < 1e-6:
+        return 0.5
+    return (value - start) / span
+
+
+def gaze_direction(landmarks: np.ndarray) -> Optional[Dict[str, Any]]:
+    """
+    Iris position inside each eye, averaged over both eyes:
+      horizontal/vertical in 0..1 (0.5 = centered) and onScreen.
+    Returns None when the landmarks carry no iris points.
+    """
+    if landmarks.shape[0] <= RIGHT_IRIS:
+        return None
+
+    horizontal = (
+        _ratio(landmarks[LEFT_IRIS, 0], landmarks[LEFT_EYE_OUTER, 0], landmarks[LEFT_EYE_INNER, 0])
+        + _ratio(landmarks[RIGHT_IRIS, 0], landmarks[RIGHT_EYE_OUTER, 0], landmarks[RIGHT_EYE_INNER, 0])
+    ) / 2
+    vertical = (
+        _ratio(landmarks[LEFT_IRIS, 1], landmarks[LEFT_EYE_TOP, 1], landmarks[LEFT_EYE_BOTTOM, 1])
+        + _ratio(landmarks[RIGHT_IRIS, 1], landmarks[RIGHT_EYE_TOP, 1], landmarks[RIGHT_EYE_BOTTOM, 1])
+    ) / 2
+
+    return {
+        "horizontal": float(horizontal),
+        "vertical": float(vertical),
+        "onScreen": bool(ON_SCREEN_RANGE[0] <= horizontal <= ON_SCREEN_RANGE[1]),
+    }
@@ -0,0 +1,40 @@
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.utils.image_utils import require_cv2
+
+# Generic 3D face model (mm) and the FaceMesh landmarks they correspond to
+MODEL_POINTS = np.array([
+    (0.0, 0.0, 0.0),           # nose tip
+    (0.0, -63.6, -12.5),       # chin
+    (-43.3, 32.7, -26.0),      # left eye outer corner
+    (43.3, 32.7, -26.0),       # right eye outer corner
+    (-28.9, -28.9, -24.1),     # left mouth corner
+    (28.9, -28.9, -24.1),      # right mouth corner
+], dtype=np.float64)
+MODEL_LANDMARKS = [1, 152, 33, 263, 61, 291]
+
+
+def head_pose(landmarks: np.ndarray, width: int, height: int) -> Optional[Dict[str, float]]:
+    """
+    Estimate head rotation in degrees ({yaw, pitch, roll}) from normalized
+    landmarks with cv2.solvePnP and a pinhole camera guess (focal = width).
+    Returns None if the pose cannot be solved.
+    """
+    cv2 = require_cv2()
+
+    image_points = landmarks[MODEL_LANDMARKS, :2].astype(np.float64) * (width, height)
+    camera = np.array([
+        (width, 0, width / 2),
+        (0, width, height / 2),
+        (0, 0, 1),
+    ], dtype=np.float64)
+
+    ok, rvec, _ = cv2.solvePnP(MODEL_POINTS, image_points, camera, np.zeros(4), flags=cv2.SOLVEPNP_ITERATIVE)
+    if not ok:
+        return None
+
+    rotation, _ = cv2.Rodrigues(rvec)
+    pitch, yaw, roll = cv2.RQDecomp3x3(rotation)[0]
+    return {"yaw": float(yaw), "pitch": float(pitch), "roll": float(roll)}
@@ -0,0 +1,68 @@
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from app.ml.face_expression import expression_features
+from app.ml.gaze import gaze_direction
+from app.ml.head_pose import head_pose
+from app.utils.image_utils import decode_jpeg, require_cv2
+
+# One FaceMesh per worker process, created on first use
+_face_mesh = None
+
+
+def require_face_mesh():
+    # mediapipe 0.10.30+ no longer ships the legacy solutions API; requirements-vision.txt pins one that does
+    try:
+        from mediapipe.solutions import face_mesh
+    except ImportError as e:
+        raise RuntimeError("Frame ingestion needs mediapipe with the face_mesh solution (pip install -r requirements-vision.txt)") from e
+    return face_mesh
+
+
+def _get_face_mesh():
+    global _face_mesh
+    if _face_mesh is None:
+        face_mesh = require_face_mesh()
+        # static_image_mode: frames from many students share this instance,
+        # so no tracking state may leak from one frame to the next.
+        _face_mesh = face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1, refine_landmarks=True)
+    return _face_mesh
+
+
+def detect_landmarks(image: np.ndarray) -> Optional[np.ndarray]:
+    """Normalized (x, y, z) FaceMesh landmarks of the most prominent face, or None."""
+    cv2 = require_cv2()
+    result = _get_face_mesh().process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    if not result.multi_face_landmarks:
+        return None
+    points = result.multi_face_landmarks[0].landmark
+    return np.array([(p.x, p.y, p.z) for p in points], dtype=np.float32)
+
+
+def extract_frame_features(data: bytes, max_side: int = 0) -> Dict[str, Any]:
+    """
+    Full CPU pipeline for one JPEG frame: decode -> landmarks -> expression,
+    gaze and head pose. Returns a features dict for score_attention.
+    Runs inside the ingestion process pool, so it must stay a top-level function.
+    """
+    image = decode_jpeg(data, max_side)
+    if image is None:
+        return {"faceDetected": False, "error": "undecodable frame"}
+
+    landmarks = detect_landmarks(image)
+    if landmarks is None:
+        return {"faceDetected": False}
+
+    features: Dict[str, Any] = {"faceDetected": True, **expression_features(landmarks)}
+
+    gaze = gaze_direction(landmarks)
+    if gaze is not None:
+        features["gaze"] = gaze
+
+    h, w = image.shape[:2]
+    pose = head_pose(landmarks, w, h)
+    if pose is not None:
+        features["headPose"] = pose
+
+    return features
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from app.services.connections import ConnectionRecord
+from app.storage.repository import now_ms
+
+logger = logging.getLogger(__name__)
+
+# Keys that change on every event without changing the student's state.
+VOLATILE_KEYS = ("ts", "timestamp")
+
+
+def same_state(a: Optional[Dict[str, Any]], b: Optional[Dict[str, Any]]) -> bool:
+    if a is None or b is None:
+        return a is b
+    if len(a) != len(b):
+        return False
+    for k, v in a.items():
+        if k in VOLATILE_KEYS:
+            continue
+        if k not in b or b[k] != v:
+            return False
+    return True
+
+
+class RoomAggregator:
+    """
+    Keeps only the latest state event per student and flushes the changes as a
+    single `room_snapshot` delta every tick.
+
+    State lives on the room's student connection records:
+    - state: latest event received from the student
+    - flushed_state: last event teachers were sent
+    Students whose latest state equals the flushed one are left out of the delta.
+    """
+
+    def __init__(
+        self,
+        room_id: str,
+        students: Dict[str, ConnectionRecord],
+        publish: Callable[[dict], Awaitable[Any]],
+        interval: float = 0.25,
+    ):
+        self.room_id = room_id
+        self.students = students
+        self.publish = publish
+        self.interval = interval
+        self.dirty: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def update(self, student_id: str, message: Dict[str, Any]):
+        record = self.students.get(student_id)
+        if record is None:
+            return
+        record.state = message
+        self.dirty.add(student_id)
+
+    def delta(self) -> Optional[Dict[str, Any]]:
+        """Collect changed states since the last flush, or None when nothing changed."""
+        changes = []
+        for sid in self.dirty:
+            record = self.students.get(sid)
+            if record is None:
+                continue
+            state = record.state
+            if same_state(state, record.flushed_state):
+                continue
+            record.flushed_state = state
+            changes.append(state)
+        self.dirty.clear()
+
+        if not changes:
+            return None
+
+        return {
+            "type": "room_snapshot",
+            "full": False,
+            "students": changes,
+            "count": len(changes),
+            "ts": now_ms()
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Latest known state of every student, for teachers that just joined."""
+        states = [record.state for record in self.students.values() if record.state is not None]
+        return {
+            "type": "room_snapshot",
+            "full": True,
+            "students": states,
+            "count": len(states),
+            "ts": now_ms()
+        }
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                message = self.delta()
+                if message:
+                    await self.publish(message)
+            except Exception as e:
+                logger.error(f"Error flushing room {self.room_id} snapshot: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
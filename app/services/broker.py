@@ -0,0 +1,352 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# deliver(room_id, envelope) is called on every worker subscribed to the room.
+# An envelope is {"target": "teacher"} or {"target": "student", "student_id": ...}
+# plus the "message" to send.
+DeliverCallback = Callable[[str, Dict[str, Any]], Awaitable[Any]]
+
+ROLES = ("teacher", "student")
+
+
+class Broker:
+    """
+    Room state and message bus shared by every worker serving the app.
+
+    ConnectionManager keeps the sockets that are local to this process and goes
+    through the broker for anything that must be visible across workers: the
+    participant list, per-role connection counts and room broadcasts.
+    """
+
+    async def start(self, deliver: DeliverCallback):
+        raise NotImplementedError
+
+    async def stop(self):
+        raise NotImplementedError
+
+    async def subscribe(self, room_id: str):
+        """Start receiving broadcasts for a room that has local connections."""
+        raise NotImplementedError
+
+    async def unsubscribe(self, room_id: str):
+        raise NotImplementedError
+
+    async def publish(self, room_id: str, envelope: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def add_member(self, room_id: str, role: str, limit: Optional[int] = None) -> bool:
+        """
+        Count a local connection in the room. With `limit`, the slot is taken
+        first and given back if that puts the role over the limit, so
+        concurrent joins can't both squeeze into the last slot.
+        """
+        raise NotImplementedError
+
+    async def remove_member(self, room_id: str, role: str):
+        raise NotImplementedError
+
+    async def get_counts(self, room_id: str) -> Dict[str, int]:
+        raise NotImplementedError
+
+    async def next_student_index(self, room_id: str) -> int:
+        """Allocate a room-unique numeric id for a joining student (used by the binary protocol)."""
+        raise NotImplementedError
+
+    async def add_student(self, room_id: str, student_id: str, info: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def update_student(self, room_id: str, student_id: str, **fields):
+        raise NotImplementedError
+
+    async def remove_student(self, room_id: str, student_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def get_students(self, room_id: str) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class InMemoryBroker(Broker):
+    """Single-process broker: publish calls straight back into the local manager."""
+
+    def __init__(self):
+        self._deliver: Optional[DeliverCallback] = None
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._students: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._next_index: Dict[str, int] = {}
+
+    async def start(self, deliver: DeliverCallback):
+        self._deliver = deliver
+
+    async def stop(self):
+        self._deliver = None
+
+    async def subscribe(self, room_id: str):
+        pass
+
+    async def unsubscribe(self, room_id: str):
+        pass
+
+    async def publish(self, room_id: str, envelope: Dict[str, Any]):
+        if self._deliver is not None:
+            await self._deliver(room_id, envelope)
+
+    async def add_member(self, room_id: str, role: str, limit: Optional[int] = None) -> bool:
+        counts = self._counts.get(room_id) or {r: 0 for r in ROLES}
+        if limit is not None and counts[role] >= limit:
+            return False
+        counts[role] += 1
+        self._counts[room_id] = counts
+        return True
+
+    async def remove_member(self, room_id: str, role: str):
+        counts = self._counts.get(room_id)
+        if counts is None:
+            return
+        counts[role] = max(0, counts[role] - 1)
+        if not any(counts.values()):
+            del self._counts[room_id]
+            self._students.pop(room_id, None)
+            self._next_index.pop(room_id, None)
+
+    async def get_counts(self, room_id: str) -> Dict[str, int]:
+        return dict(self._counts.get(room_id, {r: 0 for r in ROLES}))
+
+    async def next_student_index(self, room_id: str) -> int:
+        index = self._next_index.get(room_id, 0)
+        self._next_index[room_id] = index + 1
+        return index
+
+    async def add_student(self, room_id: str, student_id: str, info: Dict[str, Any]):
+        self._students.setdefault(room_id, {})[student_id] = dict(info)
+
+    async def update_student(self, room_id: str, student_id: str, **fields):
+        info = self._students.get(room_id, {}).get(student_id)
+        if info is not None:
+            info.update(fields)
+
+    async def remove_student(self, room_id: str, student_id: str) -> Optional[Dict[str, Any]]:
+        return self._students.get(room_id, {}).pop(student_id, None)
+
+    async def get_students(self, room_id: str) -> Dict[str, Dict[str, Any]]:
+        return {sid: dict(info) for sid, info in self._students.get(room_id, {}).items()}
+
+
+class RedisBroker(Broker):
+    """
+    Cross-process broker on top of Redis (or any Redis-compatible server).
+
+    Layout:
+    - {prefix}:room:{room_id}            pub/sub channel carrying JSON envelopes
+    - {prefix}:room:{room_id}:members    hash "{worker}:{role}" -> live connection count
+    - {prefix}:room:{room_id}:students   hash student_id -> JSON participant info (incl. owning worker)
+    - {prefix}:room:{room_id}:seq        counter for student indices
+    - {prefix}:worker:{worker}           heartbeat key, expires `member_ttl` seconds after the last beat
+    Each worker only subscribes to rooms it has local connections in. Members
+    and students are owned by the worker that holds the socket; entries of a
+    worker whose heartbeat expired (it crashed) are ignored and pruned.
+    """
+
+    def __init__(self, url: str, prefix: str = "lf", member_ttl: float = 30.0, client=None):
+        try:
+            import redis.asyncio as aioredis
+            from redis.exceptions import WatchError
+        except ImportError as e:
+            raise RuntimeError("BROKER_URL points at redis but the 'redis' package is not installed") from e
+
+        self.url = url
+        self.prefix = prefix
+        self.member_ttl = member_ttl
+        self.worker_id = uuid.uuid4().hex[:12]
+        self._watch_error = WatchError
+        self._redis = client if client is not None else aioredis.from_url(url, decode_responses=True)
+        self._pubsub = self._redis.pubsub()
+        self._deliver: Optional[DeliverCallback] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def _channel(self, room_id: str) -> str:
+        return f"{self.prefix}:room:{room_id}"
+
+    def _room_id(self, channel: str) -> str:
+        return channel[len(self.prefix) + len(":room:"):]
+
+    def _worker_key(self, worker_id: str) -> str:
+        return f"{self.prefix}:worker:{worker_id}"
+
+    async def start(self, deliver: DeliverCallback):
+        self._deliver = deliver
+        await self._beat()
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        tasks = [task for task in (self._listener, self._heartbeat) if task is not None]
+        for task in tasks:
+            task.cancel()
+        # wait for them to finish before the client they use is closed
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._listener = self._heartbeat = None
+        try:
+            # our members and students stop counting right away
+            await self._redis.delete(self._worker_key(self.worker_id))
+        except Exception as e:
+            logger.error(f"Error removing worker heartbeat: {e}")
+        await self._pubsub.aclose()
+        await self._redis.aclose()
+
+    async def _beat(self):
+        await self._redis.set(self._worker_key(self.worker_id), 1, px=int(self.member_ttl * 1000))
+
+    async def _heartbeat_loop(self):
+        # cancelling() rather than `while True`: a client may turn the cancellation into another error
+        while not asyncio.current_task().cancelling():
+            await asyncio.sleep(self.member_ttl / 3)
+            try:
+                await self._beat()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error refreshing worker heartbeat: {e}")
+
+    async def _live_workers(self, worker_ids) -> Set[str]:
+        """The given worker ids whose heartbeat has not expired (always including this one)."""
+        live = {self.worker_id}
+        others = list(set(worker_ids) - live)
+        if others:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for w in others:
+                    pipe.exists(self._worker_key(w))
+                for w, exists in zip(others, await pipe.execute()):
+                    if exists:
+                        live.add(w)
+        return live
+
+    async def _listen(self):
+        while not asyncio.current_task().cancelling():
+            # get_message() returns immediately while nothing is subscribed yet
+            if not self._pubsub.subscribed:
+                await asyncio.sleep(0.05)
+                continue
+            try:
+                msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if msg is None or msg["type"] != "message":
+                    continue
+                await self._deliver(self._room_id(msg["channel"]), json.loads(msg["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error delivering broker message: {e}")
+
+    async def subscribe(self, room_id: str):
+        await self._pubsub.subscribe(self._channel(room_id))
+
+    async def unsubscribe(self, room_id: str):
+        await self._pubsub.unsubscribe(self._channel(room_id))
+
+    async def publish(self, room_id: str, envelope: Dict[str, Any]):
+        await self._redis.publish(self._channel(room_id), json.dumps(envelope, separators=(",", ":")))
+
+    async def add_member(self, room_id: str, role: str, limit: Optional[int] = None) -> bool:
+        await self._redis.hincrby(f"{self._channel(room_id)}:members", f"{self.worker_id}:{role}", 1)
+        if limit is not None and (await self.get_counts(room_id))[role] > limit:
+            # several workers may roll back at once and all turn their joins away, never over-admit
+            await self.remove_member(room_id, role)
+            return False
+        return True
+
+    async def remove_member(self, room_id: str, role: str):
+        """
+        Decrement this worker's count and, if no live member is left, delete
+        the room's keys. Runs as one optimistic transaction over every room key,
+        so a join on another worker in the meantime aborts and retries it.
+        """
+        room = self._channel(room_id)
+        members, students, seq = f"{room}:members", f"{room}:students", f"{room}:seq"
+        field = f"{self.worker_id}:{role}"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(members, students, seq)
+                    counts = {k: int(v) for k, v in (await pipe.hgetall(members)).items()}
+                    counts[field] = counts.get(field, 0) - 1
+                    live = await self._live_workers(k.split(":", 1)[0] for k in counts)
+                    remaining = sum(v for k, v in counts.items() if v > 0 and k.split(":", 1)[0] in live)
+
+                    pipe.multi()
+                    if remaining <= 0:
+                        pipe.delete(members, students, seq)
+                    elif counts[field] <= 0:
+                        pipe.hdel(members, field)
+                    else:
+                        pipe.hincrby(members, field, -1)
+                    await pipe.execute()
+                    return
+                except self._watch_error:
+                    continue
+
+    async def get_counts(self, room_id: str) -> Dict[str, int]:
+        key = f"{self._channel(room_id)}:members"
+        raw = await self._redis.hgetall(key)
+        live = await self._live_workers(k.split(":", 1)[0] for k in raw)
+        counts = {r: 0 for r in ROLES}
+        dead = []
+        for k, v in raw.items():
+            worker, role = k.split(":", 1)
+            if worker not in live:
+                dead.append(k)
+            elif role in counts:
+                counts[role] += max(0, int(v))
+        if dead:
+            await self._redis.hdel(key, *dead)
+        return counts
+
+    async def next_student_index(self, room_id: str) -> int:
+        return await self._redis.incr(f"{self._channel(room_id)}:seq") - 1
+
+    async def add_student(self, room_id: str, student_id: str, info: Dict[str, Any]):
+        info = {**info, "worker": self.worker_id}
+        await self._redis.hset(f"{self._channel(room_id)}:students", student_id, json.dumps(info))
+
+    async def update_student(self, room_id: str, student_id: str, **fields):
+        key = f"{self._channel(room_id)}:students"
+        raw = await self._redis.hget(key, student_id)
+        if raw is not None:
+            info = json.loads(raw)
+            info.update(fields)
+            await self._redis.hset(key, student_id, json.dumps(info))
+
+    async def remove_student(self, room_id: str, student_id: str) -> Optional[Dict[str, Any]]:
+        key = f"{self._channel(room_id)}:students"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hget(key, student_id)
+            pipe.hdel(key, student_id)
+            raw, _ = await pipe.execute()
+        if raw is None:
+            return None
+        info = json.loads(raw)
+        info.pop("worker", None)
+        return info
+
+    async def get_students(self, room_id: str) -> Dict[str, Dict[str, Any]]:
+        key = f"{self._channel(room_id)}:students"
+        students = {sid: json.loads(info) for sid, info in (await self._redis.hgetall(key)).items()}
+        live = await self._live_workers(info.get("worker", self.worker_id) for info in students.values())
+        dead = [sid for sid, info in students.items() if info.get("worker", self.worker_id) not in live]
+        if dead:
+            await self._redis.hdel(key, *dead)
+        for info in students.values():
+            info.pop("worker", None)
+        return {sid: info for sid, info in students.items() if sid not in dead}
+
+
+def create_broker(url: str) -> Broker:
+    if not url or url.startswith("memory://"):
+        return InMemoryBroker()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url)
+    raise ValueError(f"Unsupported BROKER_URL: {url}")
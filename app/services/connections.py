@@ -0,0 +1,132 @@
+import asyncio
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from fastapi import WebSocket
+
+from app.utils.rate_limit import TokenBucket
+from app.utils.websocket_utils import OutboundChannel
+
+ROLES = ("teacher", "student")
+
+# Application close codes (4000-4999 are reserved for private use).
+REPLACED_CLOSE_CODE = 4000  # the same user connected again
+IDLE_CLOSE_CODE = 4001      # nothing received within the idle timeout
+
+# Standard close codes used by admission control and rate limiting.
+POLICY_VIOLATION_CLOSE_CODE = 1008
+FRAME_TOO_LARGE_CLOSE_CODE = 1009
+TRY_AGAIN_LATER_CLOSE_CODE = 1013
+
+
+class ConnectionRecord:
+    """
+    One accepted WebSocket. Student records also carry the roster entry
+    (name, index, status) and the latest/flushed state used by the room
+    aggregator, so everything about a connection is freed in one place.
+    """
+    __slots__ = (
+        "websocket", "room_id", "role", "user_id", "channel", "last_seen",
+        "name", "index", "joined_at", "status", "state", "flushed_state",
+        "bucket", "pending", "pending_task",
+    )
+
+    def __init__(self, websocket: WebSocket, room_id: str, role: str, user_id: Optional[str], channel: OutboundChannel):
+        self.websocket = websocket
+        self.room_id = room_id
+        self.role = role
+        self.user_id = user_id
+        self.channel = channel
+        self.last_seen = time.monotonic()
+        self.name: Optional[str] = None
+        self.index: Optional[int] = None
+        self.joined_at: Optional[str] = None
+        self.status = "active"
+        self.state: Optional[Dict[str, Any]] = None
+        self.flushed_state: Optional[Dict[str, Any]] = None
+        # inbound rate limit, and the latest message held back by the coalesce policy
+        self.bucket: Optional[TokenBucket] = None
+        self.pending: Optional[Dict[str, Any]] = None
+        self.pending_task: Optional[asyncio.Task] = None
+
+    def info(self) -> Dict[str, Any]:
+        """Roster entry as shared through the broker."""
+        return {"name": self.name, "index": self.index, "joined_at": self.joined_at, "status": self.status}
+
+
+class ConnectionRegistry:
+    """
+    Index of the connections on this worker:
+    - socket -> record, for everything that starts from a WebSocket
+    - room -> role -> user_id -> record, for targeted sends and fan-out
+    There is at most one record per (room, role, user_id); add() swaps a newer
+    connection in and hands back the one it replaced. Both indexes are updated
+    together without awaiting, so they can never disagree.
+    """
+
+    def __init__(self):
+        self.by_socket: Dict[WebSocket, ConnectionRecord] = {}
+        self.rooms: Dict[str, Dict[str, Dict[Any, ConnectionRecord]]] = {}
+        self.counts = {role: 0 for role in ROLES}
+
+    def __len__(self):
+        return len(self.by_socket)
+
+    def __iter__(self) -> Iterator[ConnectionRecord]:
+        return iter(self.by_socket.values())
+
+    @staticmethod
+    def _key(record: ConnectionRecord) -> Any:
+        # connections without a user id can't be replaced; key them by socket
+        return record.user_id if record.user_id is not None else record.websocket
+
+    def room(self, room_id: str) -> Dict[str, Dict[Any, ConnectionRecord]]:
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = {role: {} for role in ROLES}
+        return room
+
+    def has_room(self, room_id: str) -> bool:
+        return room_id in self.rooms
+
+    def add(self, record: ConnectionRecord) -> Optional[ConnectionRecord]:
+        members = self.room(record.room_id)[record.role]
+        key = self._key(record)
+        replaced = members.get(key)
+        if replaced is not None:
+            del self.by_socket[replaced.websocket]
+        else:
+            self.counts[record.role] += 1
+        members[key] = record
+        self.by_socket[record.websocket] = record
+        return replaced
+
+    def remove(self, websocket: WebSocket) -> Optional[ConnectionRecord]:
+        """Drop a socket's record; returns None if it was already removed or replaced."""
+        record = self.by_socket.pop(websocket, None)
+        if record is None:
+            return None
+        room = self.rooms[record.room_id]
+        members = room[record.role]
+        key = self._key(record)
+        if members.get(key) is record:
+            del members[key]
+        self.counts[record.role] -= 1
+        if not room["teacher"] and not room["student"]:
+            del self.rooms[record.room_id]
+        return record
+
+    def get(self, websocket: WebSocket) -> Optional[ConnectionRecord]:
+        return self.by_socket.get(websocket)
+
+    def user(self, room_id: str, role: str, user_id: str) -> Optional[ConnectionRecord]:
+        room = self.rooms.get(room_id)
+        return room[role].get(user_id) if room is not None else None
+
+    def members(self, room_id: str, role: str) -> Dict[Any, ConnectionRecord]:
+        room = self.rooms.get(room_id)
+        return room[role] if room is not None else {}
+
+    def idle(self, cutoff: float) -> Iterator[ConnectionRecord]:
+        """Records whose channel died or that have been silent since before `cutoff` (monotonic)."""
+        return (r for r in list(self.by_socket.values()) if r.channel.closed or r.last_seen < cutoff)
@@ -0,0 +1,142 @@
+from array import array
+from typing import Dict, Any, Optional
+import time
+
+from app.services.processor import LABELS, score_attention, generate_feedback
+
+LABEL_CODES = {label: i for i, label in enumerate(LABELS)}
+
+# Derived event emitted when the smoothed label switches to a given label
+LABEL_EVENTS = {
+    "not-visible": "no-face",
+    "eyes-closed": "eyes-closed",
+    "looking-away": "looking-away",
+    "speaking-or-laughing": "speaking-or-laughing",
+    "looking-straight": "looking-straight",
+    "attentive": "attentive",
+}
+
+# Seconds a new label must keep winning the window before it is committed.
+# Negative states need longer so one blink or dropped frame doesn't flip them.
+DEFAULT_DWELL = {
+    "not-visible": 2.0,
+    "eyes-closed": 1.5,
+    "looking-away": 1.0,
+    "speaking-or-laughing": 0.5,
+    "looking-straight": 0.5,
+    "attentive": 0.5,
+}
+
+
+class StudentState:
+    """
+    Fixed-size per-student state: a ring buffer of the last `window` label codes
+    with running per-label counts, an EMA of the score and the committed label.
+    """
+    __slots__ = ("codes", "counts", "pos", "filled", "ema", "label", "candidate", "candidate_since")
+
+    def __init__(self, window: int):
+        self.codes = array("b", [-1]) * window
+        self.counts = array("H", [0]) * len(LABELS)
+        self.pos = 0
+        self.filled = 0
+        self.ema: Optional[float] = None
+        self.label: Optional[int] = None
+        self.candidate: Optional[int] = None
+        self.candidate_since = 0.0
+
+    def push(self, code: int, score: float, alpha: float):
+        old = self.codes[self.pos]
+        if old >= 0:
+            self.counts[old] -= 1
+        else:
+            self.filled += 1
+        self.codes[self.pos] = code
+        self.counts[code] += 1
+        self.pos = (self.pos + 1) % len(self.codes)
+
+        self.ema = score if self.ema is None else self.ema + alpha * (score - self.ema)
+
+    def majority(self) -> int:
+        counts = self.counts
+        best = 0
+        for i in range(1, len(counts)):
+            if counts[i] > counts[best]:
+                best = i
+        return best
+
+
+class FeedbackEngine:
+    """
+    Incremental smoothing of per-frame attention labels.
+
+    Every frame is scored with score_attention and pushed into the student's
+    window. A different label only becomes the student's state when it holds
+    at least `enter_ratio` of the window (hysteresis) for its dwell time.
+    update() returns generate_feedback output with derived.events set only on
+    those transitions, and None otherwise.
+    """
+
+    def __init__(
+        self,
+        window: int = 15,
+        alpha: float = 0.2,
+        enter_ratio: float = 0.6,
+        dwell: Optional[Dict[str, float]] = None,
+    ):
+        self.window = window
+        self.alpha = alpha
+        self.enter_ratio = enter_ratio
+        dwell = {**DEFAULT_DWELL, **(dwell or {})}
+        self.dwell = [dwell[label] for label in LABELS]
+        self.students: Dict[str, StudentState] = {}
+
+    def update(self, student_id: str, features: Dict[str, Any], now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        res = score_attention(features)
+        event = self.push(student_id, LABEL_CODES[res["label"]], res["score"], now)
+        if event is None:
+            return None
+
+        state = self.students[student_id]
+        derived = {
+            "events": [event],
+            "label": LABELS[state.label],
+            "smoothed_score": state.ema,
+        }
+        return generate_feedback(student_id, features, derived)
+
+    def push(self, student_id: str, code: int, score: float, now: Optional[float] = None) -> Optional[str]:
+        """Advance one frame; returns the derived event name on a state transition."""
+        if now is None:
+            now = time.monotonic()
+
+        state = self.students.get(student_id)
+        if state is None:
+            state = self.students[student_id] = StudentState(self.window)
+
+        state.push(code, score, self.alpha)
+
+        winner = state.majority()
+        if winner == state.label or state.counts[winner] < self.enter_ratio * state.filled:
+            state.candidate = None
+            return None
+
+        if winner != state.candidate:
+            state.candidate = winner
+            state.candidate_since = now
+
+        if now - state.candidate_since < self.dwell[winner]:
+            return None
+
+        state.label = winner
+        state.candidate = None
+        return LABEL_EVENTS[LABELS[winner]]
+
+    def state(self, student_id: str) -> Optional[Dict[str, Any]]:
+        state = self.students.get(student_id)
+        if state is None or state.label is None:
+            return None
+        return {"label": LABELS[state.label], "smoothed_score": state.ema}
+
+    def remove(self, student_id: str):
+        self.students.pop(student_id, None)
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+
+from app.ml.landmarks import extract_frame_features
+
+logger = logging.getLogger(__name__)
+
+StudentKey = Tuple[str, str]  # (room_id, student_id)
+
+# on_features(room_id, student_id, features)
+FeaturesCallback = Callable[[str, str, Dict[str, Any]], Awaitable[Any]]
+# on_frame_rate(room_id, student_id, fps)
+FrameRateCallback = Callable[[str, str, float], Awaitable[Any]]
+
+
+class StudentFrames:
+    __slots__ = ("latest", "queued", "in_flight", "dropped", "fps", "sent_fps")
+
+    def __init__(self, fps: float):
+        self.latest: Optional[bytes] = None
+        self.queued = False
+        self.in_flight = False
+        self.dropped = 0
+        self.fps = fps
+        self.sent_fps = fps
+
+
+class FrameIngestor:
+    """
+    Server-side vision for students who upload JPEG frames instead of features.
+
+    - Only the latest frame per student is kept; a frame that arrives while an
+      older one is still waiting replaces it (the stale one is dropped).
+    - At most one frame per student is being processed at a time, and at most
+      `max_in_flight` overall, in a bounded ProcessPoolExecutor (CPU only).
+    - Processing time is tracked as an EMA to estimate pool capacity. Each
+      student's suggested frame rate is its fair share of that capacity,
+      lowered further while its own frames are being dropped. Changes of more
+      than 20% are pushed to the student through on_frame_rate.
+    """
+
+    def __init__(
+        self,
+        on_features: FeaturesCallback,
+        on_frame_rate: Optional[FrameRateCallback] = None,
+        max_workers: int = 2,
+        max_in_flight: Optional[int] = None,
+        max_fps: float = 5.0,
+        min_fps: float = 0.5,
+        max_side: int = 480,
+        executor: Optional[Executor] = None,
+    ):
+        self.on_features = on_features
+        self.on_frame_rate = on_frame_rate
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight or max_workers * 2
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.max_side = max_side
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self._executor = executor
+        self._students: Dict[StudentKey, StudentFrames] = {}
+        self._ready: Deque[StudentKey] = deque()
+        self._in_flight: Set[StudentKey] = set()
+        self._frame_time: Optional[float] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._ready) + len(self._in_flight)
+
+    def submit(self, room_id: str, student_id: str, data: bytes):
+        """Accept a frame without blocking; the previous pending frame, if any, is dropped."""
+        key = (room_id, student_id)
+        student = self._students.get(key)
+        if student is None:
+            student = self._students[key] = StudentFrames(self.max_fps)
+
+        if student.latest is not None:
+            student.dropped += 1
+            self.dropped += 1
+        student.latest = data
+
+        if not student.queued and not student.in_flight:
+            student.queued = True
+            self._ready.append(key)
+        self._dispatch()
+
+    def remove(self, room_id: str, student_id: str):
+        # any in-flight result is discarded in _finish
+        self._students.pop((room_id, student_id), None)
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self._ready and len(self._in_flight) < self.max_in_flight:
+            key = self._ready.popleft()
+            student = self._students.get(key)
+            if student is None or student.latest is None:
+                continue
+
+            data, student.latest = student.latest, None
+            student.queued = False
+            student.in_flight = True
+            self._in_flight.add(key)
+
+            future = loop.run_in_executor(
+                self._get_executor(),
+                partial(extract_frame_features, data, self.max_side),
+            )
+            asyncio.create_task(self._finish(key, future, time.monotonic()))
+
+    async def _finish(self, key: StudentKey, future: "asyncio.Future", started: float):
+        features = None
+        try:
+            features = await future
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Frame processing failed for {key[1]} in room {key[0]}: {e}")
+        finally:
+            elapsed = time.monotonic() - started
+            self._frame_time = elapsed if self._frame_time is None else 0.8 * self._frame_time + 0.2 * elapsed
+            self._in_flight.discard(key)
+
+        student = self._students.get(key)
+        if student is not None:
+            student.in_flight = False
+            if student.latest is not None and not student.queued:
+                student.queued = True
+                self._ready.append(key)
+        self._dispatch()
+
+        if student is None:
+            return
+
+        if features is not None:
+            try:
+                await self.on_features(key[0], key[1], features)
+            except Exception as e:
+                logger.error(f"Error relaying frame features for {key[1]}: {e}")
+
+        await self._throttle(key, student)
+
+    async def _throttle(self, key: StudentKey, student: StudentFrames):
+        # fair share of what the pool can process per second
+        capacity = self.max_workers / self._frame_time if self._frame_time else self.max_fps
+        target = capacity / max(1, len(self._students))
+
+        # back off further while this student's frames are being dropped
+        if student.dropped:
+            target = min(target, student.fps * 0.75)
+            student.dropped = 0
+
+        student.fps = min(self.max_fps, max(self.min_fps, target))
+
+        if self.on_frame_rate and abs(student.fps - student.sent_fps) > 0.2 * student.sent_fps:
+            student.sent_fps = student.fps
+            try:
+                await self.on_frame_rate(key[0], key[1], round(student.fps, 2))
+            except Exception as e:
+                logger.error(f"Error sending frame rate to {key[1]}: {e}")
@@ -1,7 +1,31 @@
 # app/services/processor.py
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Sequence, Union
 import math
 
+import numpy as np
+
+# Feedback message text (after the student id) keyed by label;
+# anything else falls back to "status: <label>."
+FEEDBACK_TEXT = {
+    "not-visible": " is not visible (face not detected).",
+    "eyes-closed": " seems to have eyes closed — possibly drowsy or looking down.",
+    "looking-away": " appears distracted / looking away.",
+    "speaking-or-laughing": " may be speaking or laughing.",
+    "looking-straight": " appears to be looking at the screen.",
+}
+
+# small mapping from derived events to nicer text
+DERIVED_EVENT_TEXT = {
+    "no-face": "is not visible",
+    "eyes-closed": "has eyes closed",
+    "one-eye-closed": "has one eye closed",
+    "mouth-open": "has mouth open",
+    "looking-away": "appears distracted / looking away",
+    "speaking-or-laughing": "may be speaking or laughing",
+    "looking-straight": "appears to be looking at the screen",
+    "attentive": "appears partially attentive"
+}
+
 def safe_get(d: Dict, *keys, default=None):
     v = d
     for k in keys:
@@ -89,35 +113,7 @@ def generate_feedback(student_id: str, features: Dict[str, Any], derived: Option
     score = res["score"]
     reason = res["reason"]
 
-    # Compose a short natural-language message
-    if label == "not-visible":
-        message = f"{student_id} is not visible (face not detected)."
-    elif label == "eyes-closed":
-        message = f"{student_id} seems to have eyes closed — possibly drowsy or looking down."
-    elif label == "looking-away":
-        message = f"{student_id} appears distracted / looking away."
-    elif label == "speaking-or-laughing":
-        message = f"{student_id} may be speaking or laughing."
-    elif label == "looking-straight":
-        message = f"{student_id} appears to be looking at the screen."
-    else:
-        message = f"{student_id} status: {label}."
-
-    # If derived events exist, prioritize them for the message
-    if derived and isinstance(derived.get("events"), list) and derived["events"]:
-        # choose highest-priority derived
-        ev = derived["events"][0]
-        # small mapping to nicer text
-        map_ev = {
-            "no-face": "is not visible",
-            "eyes-closed": "has eyes closed",
-            "one-eye-closed": "has one eye closed",
-            "mouth-open": "has mouth open",
-            "looking-away": "appears distracted / looking away",
-            "speaking-or-laughing": "may be speaking or laughing"
-        }
-        ev_text = map_ev.get(ev, ev)
-        message = f"{student_id} {ev_text}."
+    message = _feedback_message(student_id, label, derived)
 
     return {
         "student_id": student_id,
@@ -130,3 +126,167 @@ def generate_feedback(student_id: str, features: Dict[str, Any], derived: Option
         "features": features,
         "derived": derived or {}
     }
+
+def _feedback_message(student_id: str, label: str, derived: Optional[Dict[str, Any]]) -> str:
+    # If derived events exist, prioritize them for the message
+    if derived and isinstance(derived.get("events"), list) and derived["events"]:
+        # choose highest-priority derived
+        ev = derived["events"][0]
+        ev_text = DERIVED_EVENT_TEXT.get(ev, ev)
+        return f"{student_id} {ev_text}."
+
+    # Compose a short natural-language message
+    text = FEEDBACK_TEXT.get(label)
+    if text is None:
+        return f"{student_id} status: {label}."
+    return f"{student_id}{text}"
+
+# ---------------------------------------------------------------------------
+# Batch scoring
+#
+# Same decision tree as score_attention, evaluated over whole columns at once.
+# Scores are built with the same sequence of float64 operations as the scalar
+# path so results are bit-for-bit identical.
+# ---------------------------------------------------------------------------
+
+LABELS = (
+    "not-visible",
+    "eyes-closed",
+    "looking-away",
+    "speaking-or-laughing",
+    "looking-straight",
+    "attentive",
+)
+REASONS = (
+    "face not detected",
+    "both eyes closed",
+    "eye landmarks smaller than expected (possible looking away)",
+    "mouth open (speaking or laughing)",
+    "eyes open and landmarks within expected range",
+    "partial attention detected",
+)
+_LABELS_ARRAY = np.array(LABELS, dtype=object)
+_REASONS_ARRAY = np.array(REASONS, dtype=object)
+
+FEATURE_COLUMNS = ("faceDetected", "leftEyeOpen", "rightEyeOpen", "mouthOpen", "leftEyeDist", "rightEyeDist", "lipDist")
+
+def features_to_columns(features_list: Sequence[Optional[Dict[str, Any]]]) -> Dict[str, np.ndarray]:
+    """
+    Convert feature dicts to the columnar layout used by score_attention_batch:
+      faceDetected/leftEyeOpen/rightEyeOpen/mouthOpen -> bool arrays
+      leftEyeDist/rightEyeDist/lipDist -> float64 arrays (missing -> 0.0)
+    """
+    n = len(features_list)
+    face = np.zeros(n, dtype=bool)
+    left_open = np.zeros(n, dtype=bool)
+    right_open = np.zeros(n, dtype=bool)
+    mouth_open = np.zeros(n, dtype=bool)
+    left = np.zeros(n, dtype=np.float64)
+    right = np.zeros(n, dtype=np.float64)
+    lip = np.zeros(n, dtype=np.float64)
+
+    for i, features in enumerate(features_list):
+        if not features or not features.get("faceDetected"):
+            continue
+        face[i] = True
+        left_open[i] = bool(features.get("leftEyeOpen"))
+        right_open[i] = bool(features.get("rightEyeOpen"))
+        mouth_open[i] = bool(features.get("mouthOpen"))
+        raw = features.get("raw")
+        if isinstance(raw, dict):
+            left[i] = raw.get("leftEyeDist", 0.0) or 0.0
+            right[i] = raw.get("rightEyeDist", 0.0) or 0.0
+            lip[i] = raw.get("lipDist", 0.0) or 0.0
+
+    return {
+        "faceDetected": face,
+        "leftEyeOpen": left_open,
+        "rightEyeOpen": right_open,
+        "mouthOpen": mouth_open,
+        "leftEyeDist": left,
+        "rightEyeDist": right,
+        "lipDist": lip,
+    }
+
+def score_attention_batch(features: Union[Sequence[Optional[Dict[str, Any]]], Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    Vectorized score_attention over N records.
+    Accepts either a list of feature dicts or columns as produced by
+    features_to_columns (any array-likes of equal length).
+    Returns a dict of arrays: { code, label, score, reason }
+    where label/reason are object arrays and code indexes LABELS.
+    """
+    if not isinstance(features, dict):
+        features = features_to_columns(features)
+
+    face = np.asarray(features["faceDetected"], dtype=bool)
+    left_open = np.asarray(features["leftEyeOpen"], dtype=bool)
+    right_open = np.asarray(features["rightEyeOpen"], dtype=bool)
+    left = np.asarray(features["leftEyeDist"], dtype=np.float64)
+    right = np.asarray(features["rightEyeDist"], dtype=np.float64)
+    lip = np.asarray(features["lipDist"], dtype=np.float64)
+
+    n = face.shape[0]
+    code = np.zeros(n, dtype=np.int8)
+    score = np.full(n, 0.6, dtype=np.float64)
+
+    both_closed = face & ~left_open & ~right_open
+    remaining = face & ~both_closed
+    one_closed = remaining & ~(left_open & right_open)
+    away = remaining & (left < 0.004) & (right < 0.004)
+    speaking = remaining & ~away & (lip > 0.05)
+    straight = remaining & ~away & ~speaking & left_open & right_open
+    attentive = remaining & ~away & ~speaking & ~straight
+
+    score[both_closed] -= 0.5
+    score[one_closed] -= 0.25
+    score[away] -= 0.35
+    score[speaking] = np.minimum(1.0, score[speaking] + 0.15)
+    score[straight] = np.minimum(1.0, score[straight] + 0.3)
+    score = np.maximum(0.0, score)
+    score[~face] = 0.0
+
+    code[both_closed] = 1
+    code[away] = 2
+    code[speaking] = 3
+    code[straight] = 4
+    code[attentive] = 5
+
+    return {
+        "code": code,
+        "label": _LABELS_ARRAY[code],
+        "score": score,
+        "reason": _REASONS_ARRAY[code],
+    }
+
+def generate_feedback_batch(
+    student_ids: Sequence[str],
+    features_list: Sequence[Optional[Dict[str, Any]]],
+    derived_list: Optional[Sequence[Optional[Dict[str, Any]]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Batch equivalent of generate_feedback: one scoring pass for all records,
+    returns the same list of feedback dicts generate_feedback would.
+    """
+    res = score_attention_batch(features_list)
+    labels = res["label"].tolist()
+    scores = res["score"].tolist()
+    reasons = res["reason"].tolist()
+    if derived_list is None:
+        derived_list = [None] * len(features_list)
+
+    return [
+        {
+            "student_id": student_id,
+            "feedback": {
+                "label": label,
+                "score": score,
+                "reason": reason,
+                "message": _feedback_message(student_id, label, derived)
+            },
+            "features": features,
+            "derived": derived or {}
+        }
+        for student_id, features, derived, label, score, reason
+        in zip(student_ids, features_list, derived_list, labels, scores, reasons)
+    ]
@@ -0,0 +1,175 @@
+from array import array
+from typing import Any, Dict, Optional
+import time
+
+from app.storage.repository import event_label_score
+
+# Scores live in [0, 1]; histograms use fixed-width bins over that range.
+SCORE_BINS = 20
+
+WINDOWS = (("1m", 60), ("5m", 300))
+PERCENTILES = (50, 90)
+
+
+def _score_bin(score: float) -> int:
+    return min(SCORE_BINS - 1, max(0, int(score * SCORE_BINS)))
+
+
+def _percentile(hist: array, count: int, p: float) -> Optional[float]:
+    if count == 0:
+        return None
+    rank = p / 100 * count
+    seen = 0
+    for i in range(SCORE_BINS):
+        if hist[i] and seen + hist[i] >= rank:
+            # interpolate linearly inside the bin
+            return (i + (rank - seen) / hist[i]) / SCORE_BINS
+        seen += hist[i]
+    return 1.0
+
+
+class ScoreHistogram:
+    """Cumulative score histogram for the whole session."""
+    __slots__ = ("hist", "count", "total")
+
+    def __init__(self):
+        self.hist = array("I", [0]) * SCORE_BINS
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, score: float, now: int = 0):
+        self.hist[_score_bin(score)] += 1
+        self.count += 1
+        self.total += score
+
+    def summary(self, now: int = 0) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            **{f"p{p}": _percentile(self.hist, self.count, p) for p in PERCENTILES},
+        }
+
+
+class SlidingScoreWindow(ScoreHistogram):
+    """
+    Score histogram over the last `seconds` seconds, kept as a ring of
+    one-second buckets. Expired buckets are subtracted from the running totals
+    as time advances, so add() is O(1) amortized and summary() costs
+    O(SCORE_BINS) no matter how many events the window holds.
+    """
+    __slots__ = ("seconds", "buckets", "bucket_counts", "bucket_totals", "head")
+
+    def __init__(self, seconds: int):
+        super().__init__()
+        self.seconds = seconds
+        self.buckets = array("I", [0]) * (seconds * SCORE_BINS)
+        self.bucket_counts = array("I", [0]) * seconds
+        self.bucket_totals = array("d", [0.0]) * seconds
+        self.head: Optional[int] = None
+
+    def _advance(self, now: int):
+        if self.head is None:
+            self.head = now
+            return
+        if now <= self.head:
+            return
+
+        # clear every bucket that falls out of the window, at most one full lap
+        for second in range(max(self.head + 1, now - self.seconds + 1), now + 1):
+            slot = second % self.seconds
+            if self.bucket_counts[slot]:
+                base = slot * SCORE_BINS
+                for i in range(SCORE_BINS):
+                    self.hist[i] -= self.buckets[base + i]
+                    self.buckets[base + i] = 0
+                self.count -= self.bucket_counts[slot]
+                self.total -= self.bucket_totals[slot]
+                self.bucket_counts[slot] = 0
+                self.bucket_totals[slot] = 0.0
+        self.head = now
+        if self.count == 0:
+            # drop accumulated float error once the window is empty
+            self.total = 0.0
+
+    def add(self, score: float, now: int = 0):
+        self._advance(now)
+        slot = self.head % self.seconds
+        b = _score_bin(score)
+        self.buckets[slot * SCORE_BINS + b] += 1
+        self.bucket_counts[slot] += 1
+        self.bucket_totals[slot] += score
+        super().add(score)
+
+    def summary(self, now: int = 0) -> Dict[str, Any]:
+        self._advance(now)
+        return super().summary()
+
+
+class RoomStats:
+    """
+    Incrementally maintained aggregates for one room:
+    - current label of each student and the resulting label histogram
+    - student count per status
+    - attention score mean/percentiles over the last 1 and 5 minutes and the whole session
+    Every update is O(1); snapshot() never walks the student list.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.labels: Dict[str, str] = {}
+        self.statuses: Dict[str, str] = {}
+        self.label_counts: Dict[str, int] = {}
+        self.status_counts: Dict[str, int] = {}
+        self.events = 0
+        self.windows = {name: SlidingScoreWindow(seconds) for name, seconds in WINDOWS}
+        self.session = ScoreHistogram()
+
+    @staticmethod
+    def _move(counts: Dict[str, int], old: Optional[str], new: Optional[str]):
+        if old == new:
+            return
+        if old is not None:
+            counts[old] -= 1
+            if not counts[old]:
+                del counts[old]
+        if new is not None:
+            counts[new] = counts.get(new, 0) + 1
+
+    def student_joined(self, student_id: str, status: str = "active"):
+        self.set_status(student_id, status)
+
+    def student_left(self, student_id: str):
+        self._move(self.label_counts, self.labels.pop(student_id, None), None)
+        self._move(self.status_counts, self.statuses.pop(student_id, None), None)
+
+    def set_status(self, student_id: str, status: str):
+        self._move(self.status_counts, self.statuses.get(student_id), status)
+        self.statuses[student_id] = status
+
+    def record_event(self, student_id: str, message: Dict[str, Any], now: Optional[float] = None):
+        label, score = event_label_score(message)
+        self.events += 1
+
+        if label is not None:
+            self._move(self.label_counts, self.labels.get(student_id), label)
+            self.labels[student_id] = label
+
+        # Out-of-range scores (and NaN) would skew the means and the outer bins, so they only count as events
+        if score is not None and 0.0 <= score <= 1.0:
+            second = int(time.monotonic() if now is None else now)
+            for window in self.windows.values():
+                window.add(score, second)
+            self.session.add(score)
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Any]:
+        second = int(time.monotonic() if now is None else now)
+        return {
+            "events": self.events,
+            "session_seconds": round(time.time() - self.started_at, 1),
+            "labels": dict(self.label_counts),
+            "statuses": dict(self.status_counts),
+            "scores": {
+                **{name: window.summary(second) for name, window in self.windows.items()},
+                "session": self.session.summary(),
+            },
+        }
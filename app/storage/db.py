@@ -0,0 +1,42 @@
+import os
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS room_sessions (
+    room_id     TEXT NOT NULL,
+    started_at  INTEGER NOT NULL,   -- epoch ms
+    ended_at    INTEGER,            -- epoch ms, NULL while the session is live
+    PRIMARY KEY (room_id, started_at)
+);
+
+CREATE TABLE IF NOT EXISTS attention_events (
+    id          INTEGER PRIMARY KEY,
+    room_id     TEXT NOT NULL,
+    student_id  TEXT NOT NULL,
+    ts          INTEGER NOT NULL,   -- epoch ms
+    type        TEXT NOT NULL,
+    label       TEXT,
+    score       REAL,
+    payload     TEXT                -- the relayed message as JSON
+);
+
+CREATE INDEX IF NOT EXISTS idx_events_room_ts ON attention_events (room_id, ts);
+CREATE INDEX IF NOT EXISTS idx_events_student_ts ON attention_events (room_id, student_id, ts);
+"""
+
+
+def connect(path: str, create_schema: bool = True) -> sqlite3.Connection:
+    """
+    Open the analytics database, creating the schema if needed.
+    WAL lets readers run while the write-behind flusher commits batches.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    conn = sqlite3.connect(path, check_same_thread=False)
+    if create_schema:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+    return conn
@@ -0,0 +1,48 @@
+import csv
+import io
+import json
+from typing import Iterable, Iterator, List, Sequence
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def ndjson_chunks(batches: Iterable[List[tuple]], columns: Sequence[str]) -> Iterator[str]:
+    """
+    One JSON object per row, one chunk per batch. A `payload` column already
+    holds the event as JSON, so it is spliced in as `event` instead of being
+    parsed and re-serialized.
+    """
+    has_payload = columns and columns[-1] == "payload"
+    keys = columns[:-1] if has_payload else columns
+    for rows in batches:
+        lines = []
+        for row in rows:
+            line = json.dumps(dict(zip(keys, row)), separators=(",", ":"))
+            if has_payload:
+                line = f'{line[:-1]},"event":{row[-1] or "null"}}}'
+            lines.append(line)
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+
+def csv_chunks(batches: Iterable[List[tuple]], columns: Sequence[str]) -> Iterator[str]:
+    """Header first, then one chunk of CSV rows per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_chunks(batches: Iterable[List[tuple]], columns: Sequence[str], format: str) -> Iterator[str]:
+    if format == "csv":
+        return csv_chunks(batches, columns)
+    return ndjson_chunks(batches, columns)
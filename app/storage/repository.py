@@ -0,0 +1,234 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.storage import db
+
+logger = logging.getLogger(__name__)
+
+INSERT_EVENT = (
+    "INSERT INTO attention_events (room_id, student_id, ts, type, label, score, payload) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+INSERT_SESSION = "INSERT OR IGNORE INTO room_sessions (room_id, started_at) VALUES (?, ?)"
+END_SESSION = "UPDATE room_sessions SET ended_at = ? WHERE room_id = ? AND started_at = ?"
+
+EVENT_COLUMNS = ("room_id", "student_id", "ts", "type", "label", "score", "payload")
+SERIES_COLUMNS = ("student_id", "ts", "count", "score", "min_score", "max_score", "label")
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def event_label_score(message: Dict[str, Any]) -> Tuple[Optional[str], Optional[float]]:
+    """Pull the label/score columns out of a relayed student event."""
+    if message.get("type") == "feedback":
+        feedback = message.get("feedback") or {}
+        derived = message.get("derived") or {}
+        return derived.get("label") or feedback.get("label"), feedback.get("score")
+
+    score = message.get("score")
+    if not isinstance(score, (int, float)) or isinstance(score, bool):
+        score = None
+    return message.get("type"), score
+
+
+class EventRepository:
+    """
+    Write-behind store for attention events and room sessions.
+
+    record_* methods only append to an in-memory buffer and never block the
+    event loop. A background task drains the buffer every `flush_interval`
+    seconds (or as soon as `batch_size` rows are waiting) and writes each batch
+    in a single transaction on a worker thread. If the disk falls behind and
+    the buffer reaches `max_buffer` rows, the oldest events are dropped and
+    counted in `dropped`. A batch whose write fails (disk full, database
+    locked by another worker) goes back to the front of the buffer and is
+    retried on the next flush.
+    """
+
+    def __init__(self, path: str, batch_size: int = 2000, flush_interval: float = 0.5, max_buffer: int = 200_000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._events: Deque[tuple] = deque(maxlen=max_buffer)
+        self._sessions: List[tuple] = []
+        self._conn: Optional[sqlite3.Connection] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._events)
+
+    async def start(self):
+        if self._task is None:
+            self._conn = await asyncio.to_thread(db.connect, self.path)
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush what is still buffered and close the database."""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            if self._events:
+                logger.error(f"Dropping {len(self._events)} attention events that could not be written")
+                self.dropped += len(self._events)
+                self._events.clear()
+            await asyncio.to_thread(self._conn.close)
+            self._conn = None
+
+    def record_event(self, room_id: str, student_id: str, message: Dict[str, Any], ts: Optional[int] = None):
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append((room_id, student_id, ts or now_ms(), message))
+        if len(self._events) >= self.batch_size:
+            self._wakeup.set()
+
+    def record_session_start(self, room_id: str, started_at: int):
+        self._sessions.append((INSERT_SESSION, (room_id, started_at)))
+
+    def record_session_end(self, room_id: str, started_at: int, ended_at: Optional[int] = None):
+        self._sessions.append((END_SESSION, (ended_at or now_ms(), room_id, started_at)))
+
+    async def _run(self):
+        # Always runs one last flush after stop(), even if it is called before the first wakeup
+        stopping = False
+        while not stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            stopping = self._stopping
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.error(f"Error flushing attention events: {e}")
+
+    async def _flush(self):
+        # Only ever called from the flusher task, so batches are written one at a time
+        while self._events or self._sessions:
+            sessions, self._sessions = self._sessions, []
+            events = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+            try:
+                await asyncio.to_thread(self._write, sessions, events)
+            except Exception:
+                self._requeue(sessions, events)
+                raise
+            self.written += len(events)
+
+    def _requeue(self, sessions: List[tuple], events: List[tuple]):
+        """Put a failed batch back in front of anything recorded since, within max_buffer."""
+        self._sessions[:0] = sessions
+        overflow = max(0, len(events) - (self._events.maxlen - len(self._events)))
+        if overflow:
+            # the batch is older than everything still buffered, so its head goes first
+            self.dropped += overflow
+        self._events.extendleft(reversed(events[overflow:]))
+
+    def _write(self, sessions: List[tuple], events: List[tuple]):
+        rows = []
+        for room_id, student_id, ts, message in events:
+            label, score = event_label_score(message)
+            rows.append((room_id, student_id, ts, message.get("type", "unknown"), label, score, json.dumps(message)))
+
+        with self._conn:
+            for sql, params in sessions:
+                self._conn.execute(sql, params)
+            self._conn.executemany(INSERT_EVENT, rows)
+
+    # Queries (each runs on its own connection in a worker thread)
+
+    def _query(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        conn = db.connect(self.path, create_schema=False)
+        try:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    async def room_events(self, room_id: str, start: int, end: int, limit: int = 10000) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(
+            self._query,
+            f"SELECT {', '.join(EVENT_COLUMNS)} FROM attention_events "
+            "WHERE room_id = ? AND ts >= ? AND ts < ? ORDER BY ts LIMIT ?",
+            (room_id, start, end, limit),
+        )
+
+    async def student_events(self, room_id: str, student_id: str, start: int, end: int, limit: int = 10000) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(
+            self._query,
+            f"SELECT {', '.join(EVENT_COLUMNS)} FROM attention_events "
+            "WHERE room_id = ? AND student_id = ? AND ts >= ? AND ts < ? ORDER BY ts LIMIT ?",
+            (room_id, student_id, start, end, limit),
+        )
+
+    def _iter_query(self, sql: str, params: tuple, fetch_size: int) -> Iterator[List[tuple]]:
+        """Yield result rows in batches of `fetch_size`; the connection lives as long as the generator."""
+        conn = db.connect(self.path, create_schema=False)
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def iter_room_events(self, room_id: str, start: int, end: int, fetch_size: int = 1000) -> Iterator[List[tuple]]:
+        """Stream a room's events in time order (EVENT_COLUMNS) straight off the (room_id, ts) index."""
+        return self._iter_query(
+            f"SELECT {', '.join(EVENT_COLUMNS)} FROM attention_events "
+            "WHERE room_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+            (room_id, start, end),
+            fetch_size,
+        )
+
+    def iter_room_series(self, room_id: str, start: int, end: int, points: int) -> Iterator[List[tuple]]:
+        """
+        Stream each student's events downsampled to at most `points` buckets
+        over [start, end), one batch of SERIES_COLUMNS rows per student. A
+        bucket reports its start time, event count, mean/min/max score and the
+        label of its latest event. Students are walked lazily off the
+        (room_id, student_id, ts) index and each one is grouped by SQLite, so
+        the first series is sent before the rest of the room has been read.
+        """
+        width = max(1, -(-(end - start) // points))
+        conn = db.connect(self.path, create_schema=False)
+        try:
+            students = conn.execute(
+                "SELECT DISTINCT student_id FROM attention_events WHERE room_id = ? AND ts >= ? AND ts < ?",
+                (room_id, start, end),
+            )
+            for (student_id,) in students:
+                # SQLite takes the bare `label` column from the row that produced MAX(ts)
+                rows = conn.execute(
+                    "SELECT ? + ((ts - ?) / ?) * ? AS bucket_ts, COUNT(*), AVG(score), MIN(score), MAX(score), "
+                    "label, MAX(ts) FROM attention_events "
+                    "WHERE room_id = ? AND student_id = ? AND ts >= ? AND ts < ? "
+                    "GROUP BY (ts - ?) / ? ORDER BY bucket_ts",
+                    (start, start, width, width, room_id, student_id, start, end, start, width),
+                ).fetchall()
+                yield [(student_id, *row[:6]) for row in rows]
+        finally:
+            conn.close()
+
+    async def room_sessions(self, room_id: str) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(
+            self._query,
+            "SELECT room_id, started_at, ended_at FROM room_sessions WHERE room_id = ? ORDER BY started_at",
+            (room_id,),
+        )
@@ -0,0 +1,216 @@
+"""
+Load generator for the WebSocket relay.
+
+Starts the app under uvicorn in a subprocess (unless --url is given), opens
+N rooms with M students and K teachers each, drives student events at a fixed
+rate and reports relay latency, throughput and server memory per connection.
+
+    python -m app.tests.loadgen --rooms 5 --students 200 --teachers 2 --rate 2 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import websockets
+
+EVENT_TYPES = ("drowsy", "looking_away", "distracted", "engaged", "alert")
+
+
+@dataclass
+class LoadStats:
+    sent: int = 0
+    received: int = 0
+    latencies_ms: List[float] = field(default_factory=list)
+    errors: int = 0
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies_ms:
+            return None
+        ordered = sorted(self.latencies_ms)
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 2)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_kb(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class LocalServer:
+    """uvicorn running app.main:app in a child process on a free port."""
+
+    def __init__(self, env: Optional[Dict[str, str]] = None, args: Sequence[str] = ()):
+        self.port = _free_port()
+        self.args = list(args)
+        self.url = f"ws://127.0.0.1:{self.port}"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = {
+            **os.environ,
+            "ANALYTICS_DB_PATH": os.path.join(self.tmp.name, "load.db"),
+            **(env or {}),
+        }
+        self.proc: Optional[subprocess.Popen] = None
+
+    def __enter__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.port), "--log-level", "warning", *self.args],
+            env=self.env,
+            # keep join/leave logs out of the report
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{self.port}/health", timeout=1)
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.__exit__()
+        raise RuntimeError("server did not start")
+
+    def __exit__(self, *exc):
+        if self.proc is not None:
+            self.proc.terminate()
+            self.proc.wait(timeout=10)
+            self.proc = None
+        self.tmp.cleanup()
+
+    def rss_kb(self) -> Optional[int]:
+        return _rss_kb(self.proc.pid) if self.proc else None
+
+
+async def _teacher(url: str, room: str, teacher: str, stats: LoadStats, stop: asyncio.Event, ready: asyncio.Event):
+    async with websockets.connect(f"{url}/ws/{room}/teacher/{teacher}", max_queue=None) as ws:
+        ready.set()
+        while not stop.is_set():
+            try:
+                raw = await asyncio.wait_for(ws.recv(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            now = time.time()
+            message = json.loads(raw)
+            # relayed events carry sent_at; room snapshots carry it per student
+            events = message.get("students", []) if message.get("type") == "room_snapshot" else [message]
+            for event in events:
+                if "sent_at" in event:
+                    stats.received += 1
+                    stats.latencies_ms.append((now - event["sent_at"]) * 1000)
+
+
+async def _student(url: str, room: str, student: str, rate: float, stats: LoadStats, stop: asyncio.Event):
+    async with websockets.connect(f"{url}/ws/{room}/student/{student}?name={student}") as ws:
+        # spread students over the first interval
+        await asyncio.sleep(random.random() / rate)
+        while not stop.is_set():
+            await ws.send(json.dumps({
+                "type": random.choice(EVENT_TYPES),
+                "score": round(random.random(), 3),
+                "sent_at": time.time(),
+            }))
+            stats.sent += 1
+            await asyncio.sleep(1 / rate)
+
+
+async def run_load(url: str, rooms: int, students: int, teachers: int, rate: float, duration: float,
+                   server: Optional[LocalServer] = None) -> Dict[str, object]:
+    stats = LoadStats()
+    stop = asyncio.Event()
+    rss_before = server.rss_kb() if server else None
+
+    tasks = []
+    teacher_ready = []
+    for r in range(rooms):
+        for t in range(teachers):
+            ready = asyncio.Event()
+            teacher_ready.append(ready)
+            tasks.append(asyncio.create_task(_teacher(url, f"room-{r}", f"t{t}", stats, stop, ready)))
+    await asyncio.gather(*(ready.wait() for ready in teacher_ready))
+
+    for r in range(rooms):
+        for s in range(students):
+            tasks.append(asyncio.create_task(_student(url, f"room-{r}", f"s{s}", rate, stats, stop)))
+
+    await asyncio.sleep(min(2.0, duration / 4))
+    rss_connected = server.rss_kb() if server else None
+    sent_start, received_start, start = stats.sent, stats.received, time.monotonic()
+    stats.latencies_ms.clear()
+
+    await asyncio.sleep(duration)
+    elapsed = time.monotonic() - start
+    stop.set()
+    for result in await asyncio.gather(*tasks, return_exceptions=True):
+        if isinstance(result, Exception):
+            stats.errors += 1
+
+    connections = rooms * (students + teachers)
+    per_connection_kb = None
+    if rss_before is not None and rss_connected is not None:
+        per_connection_kb = round((rss_connected - rss_before) / connections, 1)
+
+    return {
+        "rooms": rooms,
+        "students_per_room": students,
+        "teachers_per_room": teachers,
+        "connections": connections,
+        "sent_per_sec": round((stats.sent - sent_start) / elapsed, 1),
+        "received_per_sec": round((stats.received - received_start) / elapsed, 1),
+        "latency_p50_ms": stats.percentile(50),
+        "latency_p99_ms": stats.percentile(99),
+        "server_kb_per_connection": per_connection_kb,
+        "errors": stats.errors,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="target an already running server (ws://host:port) instead of starting one")
+    parser.add_argument("--rooms", type=int, default=2)
+    parser.add_argument("--students", type=int, default=50, help="students per room")
+    parser.add_argument("--teachers", type=int, default=1, help="teachers per room")
+    parser.add_argument("--rate", type=float, default=2.0, help="events per second per student")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+
+    def run(url, server=None):
+        return asyncio.run(run_load(url, args.rooms, args.students, args.teachers, args.rate, args.duration, server))
+
+    if args.url:
+        report = run(args.url)
+    else:
+        with LocalServer() as server:
+            report = run(server.url, server)
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for key, value in report.items():
+            print(f"{key:>26}: {value}")
+
+
+if __name__ == "__main__":
+    main()
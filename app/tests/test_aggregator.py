@@ -0,0 +1,74 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app, manager
+from app.services.aggregator import RoomAggregator
+from app.services.connections import ConnectionRecord
+
+
+async def no_publish(message):
+    pass
+
+
+def make_room(*student_ids):
+    students = {sid: ConnectionRecord(object(), "r", "student", sid, channel=None) for sid in student_ids}
+    return students, RoomAggregator("r", students, no_publish)
+
+
+def event(sid, type, timestamp="t0"):
+    return {"type": type, "student_id": sid, "timestamp": timestamp}
+
+
+def test_delta_leaves_out_unchanged_states():
+    students, aggregator = make_room("s1", "s2")
+    aggregator.update("s1", event("s1", "engaged"))
+    aggregator.update("s2", event("s2", "drowsy"))
+    assert {e["student_id"] for e in aggregator.delta()["students"]} == {"s1", "s2"}
+
+    # s1 repeats its state (only the timestamp differs), s2 changes
+    aggregator.update("s1", event("s1", "engaged", "t1"))
+    aggregator.update("s2", event("s2", "alert", "t1"))
+    delta = aggregator.delta()
+    assert delta["full"] is False
+    assert delta["count"] == 1
+    assert delta["students"] == [event("s2", "alert", "t1")]
+
+
+def test_delta_is_none_when_nothing_changed():
+    students, aggregator = make_room("s1")
+    assert aggregator.delta() is None
+
+    aggregator.update("s1", event("s1", "engaged"))
+    aggregator.delta()
+    aggregator.update("s1", event("s1", "engaged", "t1"))
+    assert aggregator.delta() is None
+    # events from unknown students are ignored
+    aggregator.update("ghost", event("ghost", "drowsy"))
+    assert aggregator.delta() is None
+
+
+def test_snapshot_holds_latest_state_of_every_student():
+    students, aggregator = make_room("s1", "s2", "s3")
+    aggregator.update("s1", event("s1", "engaged"))
+    aggregator.update("s1", event("s1", "drowsy"))
+    aggregator.update("s2", event("s2", "alert"))
+    snapshot = aggregator.snapshot()
+    assert snapshot["full"] is True
+    assert sorted(e["type"] for e in snapshot["students"]) == ["alert", "drowsy"]
+
+
+def test_joining_teacher_receives_full_snapshot(monkeypatch):
+    monkeypatch.setattr(manager, "repository", None)
+    monkeypatch.setattr(settings, "room_aggregation_interval_ms", 20)
+    with TestClient(app) as client:
+        with client.websocket_connect("/ws/agg/student/s1") as student:
+            student.send_json({"type": "drowsy", "score": 0.2})
+            student.send_json({"type": "ping"})
+            assert student.receive_json() == {"type": "pong"}
+
+            with client.websocket_connect("/ws/agg/teacher/t1") as teacher:
+                assert teacher.receive_json()["type"] == "participants_list"
+                snapshot = teacher.receive_json()
+                assert snapshot["type"] == "room_snapshot"
+                assert snapshot["full"] is True
+                assert [(e["student_id"], e["type"]) for e in snapshot["students"]] == [("s1", "drowsy")]
@@ -0,0 +1,114 @@
+import asyncio
+import random
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app.core.config import settings
+from app.main import ConnectionManager
+from app.services.broker import InMemoryBroker
+from app.services.processor import generate_feedback, generate_feedback_batch, score_attention, score_attention_batch
+from app.tests.test_processor import feature_corpus
+
+
+class NullWebSocket:
+    """Accepts everything instantly so only manager overhead is measured."""
+
+    def __init__(self):
+        self.query_params = {}
+        self.scope = {}
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data):
+        pass
+
+    async def send_bytes(self, data):
+        pass
+
+    async def close(self, code=1000, reason=None):
+        pass
+
+
+@pytest.fixture
+def corpus():
+    return feature_corpus(1000)
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def room(loop, monkeypatch):
+    """A room with 200 students and 5 teachers on an in-memory manager, without the analytics store."""
+    monkeypatch.setattr(settings, "analytics_db_path", "")
+    manager = ConnectionManager(broker=InMemoryBroker())
+    teachers = [NullWebSocket() for _ in range(5)]
+    students = [NullWebSocket() for _ in range(200)]
+
+    async def setup():
+        for i, ws in enumerate(teachers):
+            await manager.connect(ws, "bench", "teacher", f"t{i}")
+        for i, ws in enumerate(students):
+            await manager.connect(ws, "bench", "student", f"s{i}")
+
+    async def teardown():
+        for ws in teachers + students:
+            await manager.disconnect(ws)
+        await manager.stop()
+        # let the cancelled writer tasks finish
+        await asyncio.sleep(0)
+
+    loop.run_until_complete(setup())
+    yield manager
+    loop.run_until_complete(teardown())
+
+
+def test_score_attention(benchmark, corpus):
+    benchmark(lambda: [score_attention(f) for f in corpus])
+
+
+def test_score_attention_batch(benchmark, corpus):
+    benchmark(score_attention_batch, corpus)
+
+
+def test_generate_feedback(benchmark, corpus):
+    ids = [f"s{i}" for i in range(len(corpus))]
+    benchmark(lambda: [generate_feedback(s, f) for s, f in zip(ids, corpus)])
+
+
+def test_generate_feedback_batch(benchmark, corpus):
+    ids = [f"s{i}" for i in range(len(corpus))]
+    benchmark(generate_feedback_batch, ids, corpus)
+
+
+def test_relay_student_event(benchmark, loop, room):
+    rng = random.Random(0)
+    message = {"type": "engaged", "score": 0.8, "student_id": "s1", "student_name": "s1", "timestamp": "2024-01-01T00:00:00"}
+
+    def relay():
+        loop.run_until_complete(room.relay_student_event("bench", f"s{rng.randrange(200)}", message))
+        # let the writer tasks drain so queues don't overflow across rounds
+        loop.run_until_complete(asyncio.sleep(0))
+
+    benchmark(relay)
+
+
+def test_connect_disconnect(benchmark, loop, room):
+    def cycle():
+        ws = NullWebSocket()
+        loop.run_until_complete(room.connect(ws, "bench", "student", "churn"))
+        loop.run_until_complete(room.disconnect(ws))
+
+    benchmark(cycle)
+
+
+def test_send_participants_list(benchmark, loop, room):
+    teacher = next(iter(room.registry.members("bench", "teacher").values())).websocket
+    benchmark(lambda: loop.run_until_complete(room.send_participants_list(teacher, "bench")))
@@ -0,0 +1,81 @@
+import math
+from datetime import datetime
+
+import pytest
+
+from app.utils.binary_protocol import (
+    EVENT_CODES, EVENT_FRAME, LABEL_CODES, NO_LABEL, SNAPSHOT, SNAPSHOT_ENTRY, SNAPSHOT_HEADER, STUDENT_FRAME,
+    VERSION, decode_student_frame, encode_binary,
+)
+from app.utils.websocket_utils import with_timestamps
+
+INDICES = {"s1": 3, "s2": 7}.get
+TS = 1_700_000_000_123
+
+
+def test_event_frame_round_trip():
+    frame = encode_binary({"type": "drowsy", "student_id": "s1", "score": 0.25, "ts": TS}, INDICES)
+    assert EVENT_FRAME.unpack(frame) == (VERSION, EVENT_CODES["drowsy"], NO_LABEL, 3, TS, 0.25)
+
+
+def test_feedback_event_carries_label_and_missing_score_as_nan():
+    frame = encode_binary({
+        "type": "feedback", "student_id": "s2", "ts": TS,
+        "feedback": {"label": "attentive"}, "derived": {"label": "eyes-closed"},
+    }, INDICES)
+    version, code, label, index, ts, score = EVENT_FRAME.unpack(frame)
+    assert (code, label, index, ts) == (EVENT_CODES["feedback"], LABEL_CODES["eyes-closed"], 7, TS)
+    assert math.isnan(score)
+
+
+def test_iso_timestamp_is_only_a_fallback():
+    iso = datetime.fromtimestamp(TS / 1000).isoformat()
+    frame = encode_binary({"type": "alert", "student_id": "s1", "timestamp": iso}, INDICES)
+    assert EVENT_FRAME.unpack(frame)[4] == TS
+
+
+def test_control_messages_and_unknown_students_have_no_binary_form():
+    assert encode_binary({"type": "student_joined", "student_id": "s1"}, INDICES) is None
+    assert encode_binary({"type": "drowsy", "student_id": "nobody", "ts": TS}, INDICES) is None
+
+
+def test_snapshot_round_trip():
+    frame = encode_binary({
+        "type": "room_snapshot", "full": True, "ts": TS,
+        "students": [
+            {"type": "engaged", "student_id": "s1", "score": 0.75, "ts": TS},
+            {"type": "distracted", "student_id": "nobody", "score": 0.1, "ts": TS},
+            {"type": "alert", "student_id": "s2", "ts": TS},
+        ],
+    }, INDICES)
+    assert SNAPSHOT_HEADER.unpack_from(frame) == (VERSION, SNAPSHOT, TS, 1, 2)
+    entries = [SNAPSHOT_ENTRY.unpack_from(frame, SNAPSHOT_HEADER.size + i * SNAPSHOT_ENTRY.size) for i in range(2)]
+    assert len(frame) == SNAPSHOT_HEADER.size + 2 * SNAPSHOT_ENTRY.size
+    assert entries[0] == (EVENT_CODES["engaged"], NO_LABEL, 3, 0.75)
+    assert entries[1][:3] == (EVENT_CODES["alert"], NO_LABEL, 7)
+    assert math.isnan(entries[1][3])
+
+
+def test_decode_student_frame():
+    assert decode_student_frame(STUDENT_FRAME.pack(VERSION, EVENT_CODES["engaged"], 0.5)) == {"type": "engaged", "score": 0.5}
+    # NaN means "no score"
+    assert decode_student_frame(STUDENT_FRAME.pack(VERSION, EVENT_CODES["drowsy"], float("nan"))) == {"type": "drowsy"}
+
+
+@pytest.mark.parametrize("frame", [
+    STUDENT_FRAME.pack(VERSION, EVENT_CODES["engaged"], 0.5)[:-1],
+    STUDENT_FRAME.pack(VERSION, EVENT_CODES["engaged"], 0.5) + b"\0",
+    STUDENT_FRAME.pack(VERSION + 1, EVENT_CODES["engaged"], 0.5),
+    STUDENT_FRAME.pack(VERSION, 0, 0.5),
+    STUDENT_FRAME.pack(VERSION, len(EVENT_CODES) + 1, 0.5),
+])
+def test_decode_rejects_bad_frames(frame):
+    with pytest.raises(ValueError):
+        decode_student_frame(frame)
+
+
+def test_json_peers_get_iso_timestamps():
+    message = with_timestamps({"type": "room_snapshot", "ts": TS, "students": [{"type": "alert", "ts": TS}]})
+    iso = datetime.fromtimestamp(TS / 1000).isoformat()
+    assert message["timestamp"] == iso
+    assert message["students"][0]["timestamp"] == iso
@@ -0,0 +1,141 @@
+import asyncio
+
+import fakeredis
+
+from app.services.broker import RedisBroker
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def start_workers(n=2, **kwargs):
+    """n RedisBroker workers sharing one fake Redis server, each recording what it delivers."""
+    server = fakeredis.FakeServer()
+    workers = []
+    for _ in range(n):
+        delivered = []
+
+        async def deliver(room_id, envelope, delivered=delivered):
+            delivered.append((room_id, envelope))
+
+        broker = RedisBroker("redis://fake", client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True), **kwargs)
+        await broker.start(deliver)
+        broker.delivered = delivered
+        workers.append(broker)
+    return workers
+
+
+async def stop_workers(workers):
+    for broker in workers:
+        await broker.stop()
+
+
+def test_membership_is_shared_and_cleaned_up_by_the_last_leave():
+    async def scenario():
+        a, b = await start_workers()
+        await a.add_member("r", "student")
+        await a.add_member("r", "student")
+        await b.add_member("r", "teacher")
+        assert await b.get_counts("r") == {"teacher": 1, "student": 2}
+
+        await a.remove_member("r", "student")
+        await a.add_student("r", "s1", {"name": "Ann", "index": await a.next_student_index("r")})
+        await a.remove_member("r", "student")
+        # b's teacher is still there, so the roster and index sequence survive
+        assert await a.get_counts("r") == {"teacher": 1, "student": 0}
+        assert "s1" in await b.get_students("r")
+        assert await b.next_student_index("r") == 1
+
+        await b.remove_member("r", "teacher")
+        assert await a.get_counts("r") == {"teacher": 0, "student": 0}
+        assert await a.get_students("r") == {}
+        assert await a.next_student_index("r") == 0
+        await stop_workers([a, b])
+
+    run(scenario())
+
+
+def test_participant_list_across_workers():
+    async def scenario():
+        a, b = await start_workers()
+        await a.add_student("r", "s1", {"name": "Ann", "index": 0, "status": "active"})
+        await b.add_student("r", "s2", {"name": "Bob", "index": 1, "status": "active"})
+        await b.update_student("r", "s1", status="away")
+
+        students = await a.get_students("r")
+        assert students == {
+            "s1": {"name": "Ann", "index": 0, "status": "away"},
+            "s2": {"name": "Bob", "index": 1, "status": "active"},
+        }
+        assert await a.remove_student("r", "s2") == {"name": "Bob", "index": 1, "status": "active"}
+        assert list(await b.get_students("r")) == ["s1"]
+        await stop_workers([a, b])
+
+    run(scenario())
+
+
+def test_publish_reaches_subscribed_workers_only():
+    async def scenario():
+        a, b, c = await start_workers(3)
+        await a.subscribe("r")
+        await b.subscribe("r")
+        await c.subscribe("other")
+        await asyncio.sleep(0.1)
+
+        envelope = {"target": "teacher", "key": None, "message": {"type": "engaged"}}
+        await c.publish("r", envelope)
+        for _ in range(50):
+            if a.delivered and b.delivered:
+                break
+            await asyncio.sleep(0.02)
+
+        assert a.delivered == [("r", envelope)]
+        assert b.delivered == [("r", envelope)]
+        assert c.delivered == []
+        await stop_workers([a, b, c])
+
+    run(scenario())
+
+
+def test_members_of_a_dead_worker_expire():
+    async def scenario():
+        a, b = await start_workers(member_ttl=0.3)
+        await a.add_member("r", "student")
+        await a.add_student("r", "s1", {"name": "Ann", "index": 0})
+        await b.add_member("r", "teacher")
+        assert await b.get_counts("r") == {"teacher": 1, "student": 1}
+
+        # a crashes: its heartbeat stops and the key expires
+        crashed = [a._heartbeat, a._listener]
+        for task in crashed:
+            task.cancel()
+        await asyncio.gather(*crashed, return_exceptions=True)
+        await asyncio.sleep(0.5)
+
+        assert await b.get_counts("r") == {"teacher": 1, "student": 0}
+        assert await b.get_students("r") == {}
+        # the last live member leaving clears the room despite a's leftovers
+        await b.remove_member("r", "teacher")
+        assert not await b._redis.exists("lf:room:r:members")
+        await stop_workers([b])
+        await a._pubsub.aclose()
+        await a._redis.aclose()
+
+    run(scenario())
+
+
+def test_concurrent_joins_never_exceed_the_room_limit():
+    async def scenario():
+        a, b = await start_workers()
+        await a.add_member("r", "teacher")
+        await a.add_member("r", "student", limit=3)
+        admitted = await asyncio.gather(*(w.add_member("r", "student", limit=3) for w in (a, b) * 4))
+        counts = await a.get_counts("r")
+        # rollbacks may turn away joins that would have fit, never admit too many
+        assert 1 <= sum(admitted) <= 2
+        assert counts == {"teacher": 1, "student": 1 + sum(admitted)}
+        assert await a.add_member("r", "teacher", limit=0) is False
+        await stop_workers([a, b])
+
+    run(scenario())
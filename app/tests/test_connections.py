@@ -0,0 +1,53 @@
+import time
+
+from app.services.connections import ConnectionRecord, ConnectionRegistry
+from app.utils.websocket_utils import OutboundChannel
+
+
+def record(room_id, role, user_id, ws=None):
+    ws = ws or object()
+    return ConnectionRecord(ws, room_id, role, user_id, OutboundChannel(ws))
+
+
+def test_add_replaces_same_user_atomically():
+    registry = ConnectionRegistry()
+    first = record("r", "student", "s1")
+    assert registry.add(first) is None
+
+    second = record("r", "student", "s1")
+    assert registry.add(second) is first
+    assert registry.get(first.websocket) is None
+    assert registry.user("r", "student", "s1") is second
+    assert registry.counts == {"teacher": 0, "student": 1}
+
+    # the replaced socket's own teardown must not touch the new record
+    assert registry.remove(first.websocket) is None
+    assert registry.user("r", "student", "s1") is second
+
+
+def test_remove_drops_empty_rooms():
+    registry = ConnectionRegistry()
+    teacher, student = record("r", "teacher", "t1"), record("r", "student", "s1")
+    registry.add(teacher)
+    registry.add(student)
+
+    assert registry.remove(student.websocket) is student
+    assert registry.has_room("r")
+    assert registry.remove(teacher.websocket) is teacher
+    assert not registry.has_room("r")
+    assert len(registry) == 0
+    assert registry.counts == {"teacher": 0, "student": 0}
+
+
+def test_idle_returns_silent_and_dead_connections():
+    registry = ConnectionRegistry()
+    quiet, active, dead = record("r", "student", "a"), record("r", "student", "b"), record("r", "teacher", "t")
+    for r in (quiet, active, dead):
+        registry.add(r)
+    now = time.monotonic()
+    quiet.last_seen = now - 120
+    active.last_seen = dead.last_seen = now
+    dead.channel.close()
+
+    assert {r.user_id for r in registry.idle(now - 60)} == {"a", "t"}
+    assert {r.user_id for r in registry.idle(float("-inf"))} == {"t"}
@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app, manager
+from app.storage.repository import EventRepository
+
+START = 1_700_000_000_000
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    repository = EventRepository(str(tmp_path / "events.db"))
+    monkeypatch.setattr(manager, "repository", repository)
+    with TestClient(app) as client:
+        # two students, one event per second for 100 seconds
+        events = [
+            ("r1", sid, START + i * 1000, {"type": "engaged" if i % 2 else "drowsy", "score": i / 100})
+            for i in range(100)
+            for sid in ("s1", "s2")
+        ]
+        repository._write([], events)
+        yield client
+
+
+def test_export_ndjson_streams_events_in_time_order(client):
+    response = client.get("/rooms/r1/events", params={"start": START, "end": START + 10_000})
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 20
+    assert [row["ts"] for row in rows] == sorted(row["ts"] for row in rows)
+    assert rows[0]["event"] == {"type": "drowsy", "score": 0.0}
+    assert rows[0]["label"] == "drowsy"
+
+
+def test_export_csv(client):
+    response = client.get("/rooms/r1/events", params={"start": START, "end": START + 100_000, "format": "csv"})
+    assert response.headers["content-type"].startswith("text/csv")
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 200
+    assert rows[0]["student_id"] in ("s1", "s2")
+
+
+def test_export_downsampled_per_student(client):
+    response = client.get("/rooms/r1/events", params={"start": START, "end": START + 100_000, "points": 10})
+    rows = [json.loads(line) for line in response.text.splitlines()]
+
+    assert [row["student_id"] for row in rows] == ["s1"] * 10 + ["s2"] * 10
+    first = rows[0]
+    assert first["ts"] == START
+    assert first["count"] == 10
+    assert first["min_score"] == 0.0 and first["max_score"] == 0.09
+    assert first["score"] == pytest.approx(0.045)
+    # label of the latest event in the bucket
+    assert first["label"] == "engaged"
+
+
+def test_export_rejects_bad_ranges(client):
+    assert client.get("/rooms/r1/events", params={"start": 10, "end": 5}).status_code == 400
+    assert client.get("/rooms/r1/events", params={"format": "xml"}).status_code == 400
@@ -0,0 +1,62 @@
+from app.services.feedback_generator import DEFAULT_DWELL, LABEL_CODES, FeedbackEngine
+
+ATTENTIVE = LABEL_CODES["attentive"]
+EYES_CLOSED = LABEL_CODES["eyes-closed"]
+FPS = 10
+
+
+def feed(engine, code, seconds, start, student="s1"):
+    """Push `seconds` worth of frames of one label; returns (events, end time)."""
+    events = []
+    t = start
+    for _ in range(int(seconds * FPS)):
+        event = engine.push(student, code, 0.5, now=t)
+        if event is not None:
+            events.append((event, t))
+        t += 1 / FPS
+    return events, t
+
+
+def settled_engine():
+    engine = FeedbackEngine(window=15)
+    events, t = feed(engine, ATTENTIVE, 3, 0.0)
+    assert [e for e, _ in events] == ["attentive"]
+    return engine, t
+
+
+def test_single_noisy_frame_does_not_emit():
+    engine, t = settled_engine()
+    assert engine.push("s1", EYES_CLOSED, 0.1, now=t) is None
+    events, _ = feed(engine, ATTENTIVE, 2, t + 0.1)
+    assert events == []
+    assert engine.state("s1")["label"] == "attentive"
+
+
+def test_sustained_change_emits_once_after_dwell():
+    engine, t = settled_engine()
+    events, _ = feed(engine, EYES_CLOSED, 5, t)
+
+    assert [e for e, _ in events] == ["eyes-closed"]
+    # the majority flips after ~60% of the window, then the dwell time must pass
+    emitted_at = events[0][1]
+    assert emitted_at - t >= DEFAULT_DWELL["eyes-closed"]
+    assert emitted_at - t < DEFAULT_DWELL["eyes-closed"] + 15 / FPS
+    assert engine.state("s1")["label"] == "eyes-closed"
+
+
+def test_change_shorter_than_dwell_is_ignored():
+    engine, t = settled_engine()
+    # long enough to win the window, not long enough to outlast the dwell
+    events, t = feed(engine, EYES_CLOSED, 1.5, t)
+    events += feed(engine, ATTENTIVE, 3, t)[0]
+    assert events == []
+
+
+def test_remove_frees_student_state():
+    engine, _ = settled_engine()
+    feed(engine, ATTENTIVE, 1, 0.0, student="s2")
+    engine.remove("s1")
+    assert "s1" not in engine.students
+    assert engine.state("s1") is None
+    assert list(engine.students) == ["s2"]
+    engine.remove("missing")
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services import ingestion
+from app.services.ingestion import FrameIngestor
+
+
+class FakeExtractor:
+    """Stands in for extract_frame_features; each call blocks until the test opens the gate."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.calls = []
+
+    def __call__(self, data, max_side=0):
+        self.calls.append(data)
+        self.gate.wait(5)
+        if data == b"bad":
+            raise ValueError("undecodable frame")
+        return {"frame": data.decode()}
+
+
+@pytest.fixture
+def extractor(monkeypatch):
+    fake = FakeExtractor()
+    monkeypatch.setattr(ingestion, "extract_frame_features", fake)
+    yield fake
+    fake.gate.set()
+
+
+def make_ingestor(**kwargs):
+    received = []
+    rates = []
+
+    async def on_features(room_id, student_id, features):
+        received.append((student_id, features["frame"]))
+
+    async def on_frame_rate(room_id, student_id, fps):
+        rates.append((student_id, fps))
+
+    ingestor = FrameIngestor(on_features, on_frame_rate, executor=ThreadPoolExecutor(4), **kwargs)
+    return ingestor, received, rates
+
+
+async def settle(condition, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+
+def test_newer_frame_replaces_the_waiting_one(extractor):
+    async def scenario():
+        ingestor, received, _ = make_ingestor()
+        ingestor.submit("r", "s1", b"f1")
+        ingestor.submit("r", "s1", b"f2")
+        ingestor.submit("r", "s1", b"f3")
+        assert await settle(lambda: extractor.calls == [b"f1"])
+        # one frame per student in flight: f2 was replaced before it ever reached the pool
+        assert ingestor.dropped == 1
+        assert ingestor.queue_depth == 1
+
+        extractor.gate.set()
+        assert await settle(lambda: len(received) == 2)
+        assert extractor.calls == [b"f1", b"f3"]
+        assert received == [("s1", "f1"), ("s1", "f3")]
+        assert ingestor.processed == 2
+        ingestor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_in_flight_is_bounded_across_students(extractor):
+    async def scenario():
+        ingestor, received, _ = make_ingestor(max_in_flight=2)
+        for student_id in ("s1", "s2", "s3"):
+            ingestor.submit("r", student_id, student_id.encode())
+        assert await settle(lambda: len(extractor.calls) == 2)
+        await asyncio.sleep(0.05)
+        assert len(extractor.calls) == 2
+        assert ingestor.queue_depth == 3
+
+        extractor.gate.set()
+        assert await settle(lambda: len(received) == 3)
+        assert sorted(received) == [("s1", "s1"), ("s2", "s2"), ("s3", "s3")]
+        ingestor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_failed_frames_and_removed_students_are_not_relayed(extractor):
+    async def scenario():
+        ingestor, received, _ = make_ingestor()
+        ingestor.submit("r", "s1", b"bad")
+        ingestor.submit("r", "s2", b"f1")
+        assert await settle(lambda: len(extractor.calls) == 2)
+        ingestor.remove("r", "s2")
+
+        extractor.gate.set()
+        assert await settle(lambda: ingestor.failed == 1 and ingestor.processed == 1)
+        await asyncio.sleep(0.05)
+        assert received == []
+        assert ingestor.queue_depth == 0
+        ingestor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_frame_rate_follows_pool_capacity_and_drops():
+    async def scenario():
+        ingestor, _, rates = make_ingestor(max_workers=2, max_fps=5.0, min_fps=0.5)
+        for student_id in ("s1", "s2", "s3", "s4"):
+            ingestor._students[("r", student_id)] = ingestion.StudentFrames(ingestor.max_fps)
+        s1 = ingestor._students[("r", "s1")]
+
+        # 0.5 s per frame on 2 workers is 4 fps, shared by 4 students
+        ingestor._frame_time = 0.5
+        await ingestor._throttle(("r", "s1"), s1)
+        assert rates == [("s1", 1.0)]
+
+        # within 20% of what was last sent: nothing new is pushed
+        ingestor._frame_time = 0.45
+        await ingestor._throttle(("r", "s1"), s1)
+        assert s1.fps == pytest.approx(2 / 0.45 / 4)
+        assert rates == [("s1", 1.0)]
+
+        # dropped frames back the student off below its fair share, down to min_fps
+        ingestor._frame_time = 0.5
+        for _ in range(10):
+            s1.dropped = 1
+            await ingestor._throttle(("r", "s1"), s1)
+        assert s1.fps == 0.5
+        # 0.62 -> 0.5 is under the 20% threshold, so the last step is not pushed
+        assert rates[-1] == ("s1", 0.62)
+        assert all(fps < previous for (_, fps), (_, previous) in zip(rates[1:], rates))
+        ingestor.shutdown()
+
+    asyncio.run(scenario())
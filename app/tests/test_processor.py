@@ -0,0 +1,96 @@
+import random
+
+import numpy as np
+
+from app.services.processor import (
+    features_to_columns,
+    generate_feedback,
+    generate_feedback_batch,
+    score_attention,
+    score_attention_batch,
+)
+
+# Values straddling every threshold used by score_attention
+EYE_DISTS = [None, 0, 0.0, 0.001, 0.0039999, 0.004, 0.0041, 0.02]
+LIP_DISTS = [None, 0, 0.01, 0.05, 0.0500001, 0.2]
+
+
+def random_features(rng: random.Random):
+    kind = rng.random()
+    if kind < 0.05:
+        return None
+    if kind < 0.1:
+        return {}
+    features = {
+        "faceDetected": rng.choice([True, True, True, False, 1, 0, None]),
+        "leftEyeOpen": rng.choice([True, False, None, 1]),
+        "rightEyeOpen": rng.choice([True, False, 0]),
+        "mouthOpen": rng.choice([True, False]),
+    }
+    if rng.random() < 0.9:
+        raw = {}
+        for key, values in (("leftEyeDist", EYE_DISTS), ("rightEyeDist", EYE_DISTS), ("lipDist", LIP_DISTS)):
+            if rng.random() < 0.9:
+                raw[key] = rng.choice(values)
+        features["raw"] = raw if rng.random() < 0.95 else "garbage"
+    return features
+
+
+def feature_corpus(n=5000, seed=1234):
+    rng = random.Random(seed)
+    return [random_features(rng) for _ in range(n)]
+
+
+def test_batch_matches_scalar_scores():
+    corpus = feature_corpus()
+    batch = score_attention_batch(corpus)
+
+    for i, features in enumerate(corpus):
+        expected = score_attention(features)
+        assert batch["label"][i] == expected["label"]
+        assert batch["score"][i] == expected["score"]
+        assert batch["reason"][i] == expected["reason"]
+
+
+def test_batch_covers_every_label():
+    batch = score_attention_batch(feature_corpus())
+    assert set(batch["label"].tolist()) == {
+        "not-visible",
+        "eyes-closed",
+        "looking-away",
+        "speaking-or-laughing",
+        "looking-straight",
+        "attentive",
+    }
+
+
+def test_batch_accepts_columns():
+    corpus = feature_corpus(500)
+    columns = features_to_columns(corpus)
+    from_columns = score_attention_batch({k: v.tolist() for k, v in columns.items()})
+    from_dicts = score_attention_batch(corpus)
+
+    assert np.array_equal(from_columns["code"], from_dicts["code"])
+    assert np.array_equal(from_columns["score"], from_dicts["score"])
+
+
+def test_batch_empty():
+    batch = score_attention_batch([])
+    assert batch["score"].shape == (0,)
+    assert generate_feedback_batch([], []) == []
+
+
+def test_generate_feedback_batch_matches_scalar():
+    corpus = feature_corpus(2000)
+    ids = [f"student-{i}" for i in range(len(corpus))]
+    rng = random.Random(99)
+    derived = [
+        rng.choice([None, {}, {"events": []}, {"events": ["no-face"]}, {"events": ["custom-event", "eyes-closed"]}])
+        for _ in corpus
+    ]
+
+    batch = generate_feedback_batch(ids, corpus, derived)
+    expected = [generate_feedback(sid, f, d) for sid, f, d in zip(ids, corpus, derived)]
+    assert batch == expected
+
+    assert generate_feedback_batch(ids, corpus) == [generate_feedback(sid, f) for sid, f in zip(ids, corpus)]
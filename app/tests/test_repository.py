@@ -0,0 +1,101 @@
+import asyncio
+
+from app.storage.repository import EventRepository
+
+START = 1_700_000_000_000
+
+
+def record(repository, n, offset=0):
+    for i in range(n):
+        repository.record_event("r", "s1", {"type": "engaged", "score": 0.5}, ts=START + offset + i)
+
+
+async def wait_for(condition, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+
+def test_full_batch_is_written_without_waiting_for_the_interval(tmp_path):
+    async def scenario():
+        repository = EventRepository(str(tmp_path / "e.db"), batch_size=3, flush_interval=60)
+        await repository.start()
+        record(repository, 2)
+        await asyncio.sleep(0.05)
+        assert repository.written == 0
+        record(repository, 1, offset=2)
+        assert await wait_for(lambda: repository.written == 3)
+        await repository.stop()
+
+    asyncio.run(scenario())
+
+
+def test_partial_batch_is_written_after_the_interval(tmp_path):
+    async def scenario():
+        repository = EventRepository(str(tmp_path / "e.db"), batch_size=1000, flush_interval=0.05)
+        await repository.start()
+        record(repository, 5)
+        assert await wait_for(lambda: repository.written == 5)
+        assert len(await repository.room_events("r", START, START + 10)) == 5
+        await repository.stop()
+
+    asyncio.run(scenario())
+
+
+def test_overflow_drops_oldest_and_counts_them(tmp_path):
+    repository = EventRepository(str(tmp_path / "e.db"), max_buffer=3)
+    record(repository, 5)
+    assert repository.dropped == 2
+    assert [event[2] for event in repository._events] == [START + 2, START + 3, START + 4]
+
+
+def test_stop_flushes_everything_buffered(tmp_path):
+    async def scenario():
+        repository = EventRepository(str(tmp_path / "e.db"), batch_size=2, flush_interval=60)
+        await repository.start()
+        repository.record_session_start("r", START)
+        record(repository, 5)
+        await repository.stop()
+        assert repository.written == 5
+        assert repository.pending == 0
+        assert len(await repository.room_events("r", START, START + 10)) == 5
+        assert await repository.room_sessions("r") == [{"room_id": "r", "started_at": START, "ended_at": None}]
+
+    asyncio.run(scenario())
+
+
+def test_failed_batch_is_retried(tmp_path):
+    async def scenario():
+        repository = EventRepository(str(tmp_path / "e.db"), batch_size=10, flush_interval=0.05)
+        await repository.start()
+        write = repository._write
+        failures = []
+
+        def flaky_write(sessions, events):
+            if not failures:
+                failures.append(len(events))
+                raise OSError("disk full")
+            write(sessions, events)
+
+        repository._write = flaky_write
+        record(repository, 4)
+        assert await wait_for(lambda: repository.written == 4)
+        await repository.stop()
+        assert failures == [4]
+        assert repository.dropped == 0
+        rows = await repository.room_events("r", START, START + 10)
+        assert [row["ts"] for row in rows] == [START + i for i in range(4)]
+
+    asyncio.run(scenario())
+
+
+def test_requeue_respects_max_buffer(tmp_path):
+    repository = EventRepository(str(tmp_path / "e.db"), max_buffer=4)
+    record(repository, 3, offset=10)
+    failed = [("r", "s1", START + i, {"type": "engaged"}) for i in range(3)]
+    repository._requeue([], failed)
+    # one slot left: only the newest event of the failed batch fits
+    assert repository.dropped == 2
+    assert [event[2] for event in repository._events] == [START + 2, START + 10, START + 11, START + 12]
@@ -0,0 +1,82 @@
+import pytest
+
+from app.services.room_stats import RoomStats, SlidingScoreWindow
+
+
+def scored(score, type="engaged"):
+    return {"type": type, "score": score}
+
+
+def test_window_forgets_scores_older_than_its_span():
+    window = SlidingScoreWindow(60)
+    window.add(0.2, now=100)
+    window.add(0.8, now=130)
+    assert window.summary(now=159)["count"] == 2
+
+    summary = window.summary(now=160)
+    assert summary["count"] == 1
+    assert summary["mean"] == pytest.approx(0.8)
+
+    empty = window.summary(now=1000)
+    assert empty == {"count": 0, "mean": None, "p50": None, "p90": None}
+    assert window.total == 0.0
+
+
+def test_window_accepts_a_jump_longer_than_its_span():
+    window = SlidingScoreWindow(5)
+    for second in range(5):
+        window.add(0.5, now=second)
+    window.add(0.9, now=1000)
+    summary = window.summary(now=1000)
+    assert summary["count"] == 1
+    assert summary["mean"] == pytest.approx(0.9)
+
+
+def test_percentiles_interpolate_within_bins():
+    stats = RoomStats()
+    for i in range(100):
+        stats.record_event("s1", scored(i / 100), now=0)
+
+    session = stats.snapshot(now=0)["scores"]["session"]
+    assert session["count"] == 100
+    assert session["mean"] == pytest.approx(0.495)
+    assert session["p50"] == pytest.approx(0.5, abs=0.05)
+    assert session["p90"] == pytest.approx(0.9, abs=0.05)
+    assert stats.snapshot(now=0)["scores"]["1m"] == session
+
+
+def test_label_and_status_histograms_follow_join_and_leave():
+    stats = RoomStats()
+    stats.student_joined("s1")
+    stats.student_joined("s2")
+    stats.record_event("s1", scored(0.9, "engaged"))
+    stats.record_event("s2", scored(0.9, "engaged"))
+    stats.set_status("s2", "away")
+    assert stats.label_counts == {"engaged": 2}
+    assert stats.status_counts == {"active": 1, "away": 1}
+
+    stats.record_event("s2", scored(0.1, "drowsy"))
+    assert stats.label_counts == {"engaged": 1, "drowsy": 1}
+
+    stats.student_left("s2")
+    assert stats.label_counts == {"engaged": 1}
+    assert stats.status_counts == {"active": 1}
+
+    stats.student_left("s1")
+    stats.student_left("s1")
+    assert stats.label_counts == {}
+    assert stats.status_counts == {}
+
+
+def test_out_of_range_scores_are_not_aggregated():
+    stats = RoomStats()
+    stats.record_event("s1", scored(1.7))
+    stats.record_event("s1", scored(-0.3))
+    stats.record_event("s1", scored(float("nan")))
+    stats.record_event("s1", scored(0.4))
+
+    snapshot = stats.snapshot()
+    assert snapshot["events"] == 4
+    assert snapshot["labels"] == {"engaged": 1}
+    assert snapshot["scores"]["session"]["count"] == 1
+    assert snapshot["scores"]["session"]["mean"] == pytest.approx(0.4)
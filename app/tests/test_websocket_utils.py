@@ -0,0 +1,118 @@
+import asyncio
+
+from app.utils.websocket_utils import (
+    SEND_ERROR_CLOSE_CODE, SLOW_CONSUMER_CLOSE_CODE, OutboundChannel, payload_size,
+)
+
+
+class SlowWebSocket:
+    """Blocks every send until released, so the outbound queue fills up."""
+
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+        self.release = asyncio.Event()
+
+    async def send_text(self, data):
+        await self.release.wait()
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        await self.send_text(data)
+
+    async def close(self, code=1000, reason=None):
+        self.closed_with = code
+
+
+async def fill(policy, payloads):
+    ws = SlowWebSocket()
+    channel = OutboundChannel(ws, maxsize=3, policy=policy)
+    channel.start()
+    # the writer takes the first payload and blocks sending it
+    channel.send("first", key="a")
+    await asyncio.sleep(0)
+    results = [channel.send(payload, key) for payload, key in payloads]
+    return ws, channel, results
+
+
+async def drain(ws, channel):
+    ws.release.set()
+    for _ in range(10):
+        await asyncio.sleep(0)
+    channel.close()
+
+
+def test_drop_oldest():
+    async def run():
+        ws, channel, results = await fill("drop-oldest", [(f"m{i}", None) for i in range(5)])
+        assert results == [True] * 5
+        assert channel.dropped == 2
+        await drain(ws, channel)
+        return ws.sent
+
+    assert asyncio.run(run()) == ["first", "m2", "m3", "m4"]
+
+
+def test_coalesce_replaces_queued_payload_with_same_key():
+    async def run():
+        ws, channel, results = await fill("coalesce", [("a1", "a"), ("b1", "b"), ("c1", "c"), ("b2", "b")])
+        assert results == [True] * 4
+        assert channel.dropped == 1
+        await drain(ws, channel)
+        return ws.sent
+
+    assert asyncio.run(run()) == ["first", "a1", "c1", "b2"]
+
+
+def test_disconnect_slow_consumer():
+    async def run():
+        ws, channel, results = await fill("disconnect", [(f"m{i}", None) for i in range(4)])
+        assert results == [True, True, True, False]
+        assert channel.closed
+        assert not channel.send("late")
+        for _ in range(3):
+            await asyncio.sleep(0)
+        assert ws.closed_with == SLOW_CONSUMER_CLOSE_CODE
+        # the writer stopped and nothing queued is sent after the close
+        ws.release.set()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return ws.sent, channel._task.done()
+
+    sent, writer_done = asyncio.run(run())
+    assert sent == []
+    assert writer_done
+
+
+def test_send_timeout_closes_the_socket():
+    async def run():
+        ws = SlowWebSocket()
+        channel = OutboundChannel(ws, maxsize=3, send_timeout=0.01)
+        channel.start()
+        channel.send("stuck")
+        await asyncio.wait_for(channel._task, 1)
+        return ws.closed_with, channel.closed
+
+    assert asyncio.run(run()) == (SLOW_CONSUMER_CLOSE_CODE, True)
+
+
+def test_send_error_closes_the_socket():
+    class BrokenWebSocket(SlowWebSocket):
+        async def send_text(self, data):
+            raise RuntimeError("connection reset")
+
+    async def run():
+        ws = BrokenWebSocket()
+        channel = OutboundChannel(ws, maxsize=3)
+        channel.start()
+        channel.send("lost")
+        await asyncio.wait_for(channel._task, 1)
+        return ws.closed_with, channel.closed
+
+    assert asyncio.run(run()) == (SEND_ERROR_CLOSE_CODE, True)
+
+
+def test_payload_size_counts_utf8_bytes():
+    assert payload_size(b"\x00\xff") == 2
+    assert payload_size('{"a":1}') == 7
+    assert payload_size('{"n":"très"}') == 13
@@ -0,0 +1,349 @@
+import asyncio
+import json
+import urllib.request
+from datetime import datetime
+
+import pytest
+import websockets
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.core.config import settings
+from app.core.metrics import BYTES_IN, OVERSIZED_FRAMES
+from app.main import ConnectionManager, app, manager
+from app.services.broker import InMemoryBroker
+from app.services.connections import REPLACED_CLOSE_CODE
+from app.tests.loadgen import LocalServer, run_load
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # keep the analytics store out of the working tree
+    monkeypatch.setattr(manager, "repository", None)
+    with TestClient(app) as client:
+        yield client
+
+
+def test_student_event_relayed_to_teachers(client):
+    with client.websocket_connect("/ws/r1/teacher/t1") as teacher:
+        assert teacher.receive_json()["type"] == "participants_list"
+
+        with client.websocket_connect("/ws/r1/student/s1?name=Ann") as student:
+            joined = teacher.receive_json()
+            assert joined["type"] == "student_joined"
+            assert joined["name"] == "Ann"
+
+            student.send_json({"type": "drowsy", "score": 0.2})
+            event = teacher.receive_json()
+            assert event["type"] == "drowsy"
+            assert event["student_id"] == "s1"
+            assert event["student_name"] == "Ann"
+            assert event["score"] == 0.2
+            assert isinstance(event["ts"], int)
+            assert event["timestamp"].startswith(str(datetime.fromtimestamp(event["ts"] / 1000).date()))
+
+        assert teacher.receive_json()["type"] == "student_left"
+
+
+def test_teacher_message_reaches_student(client):
+    with client.websocket_connect("/ws/r2/teacher/t1") as teacher:
+        teacher.receive_json()
+        with client.websocket_connect("/ws/r2/student/s1") as student:
+            teacher.receive_json()
+            teacher.send_json({"type": "message_to_student", "student_id": "s1", "message": "eyes up"})
+            message = student.receive_json()
+            assert message["type"] == "teacher_message"
+            assert message["message"] == "eyes up"
+
+
+def test_reconnect_replaces_previous_connection(client):
+    with client.websocket_connect("/ws/r4/teacher/t1") as teacher:
+        teacher.receive_json()
+        with client.websocket_connect("/ws/r4/student/s1?name=Ann") as first:
+            assert teacher.receive_json()["type"] == "student_joined"
+
+            with client.websocket_connect("/ws/r4/student/s1") as second:
+                with pytest.raises(WebSocketDisconnect) as closed:
+                    first.receive_json()
+                assert closed.value.code == REPLACED_CLOSE_CODE
+
+                second.send_json({"type": "ping"})
+                assert second.receive_json() == {"type": "pong"}
+                assert len(manager.registry.members("r4", "student")) == 1
+
+                # the reconnect is invisible to teachers and keeps the roster entry
+                second.send_json({"type": "alert", "score": 0.7})
+                event = teacher.receive_json()
+                assert event["type"] == "alert"
+                assert event["student_name"] == "Ann"
+
+        assert teacher.receive_json()["type"] == "student_left"
+
+
+def test_rate_limit_close_policy(client, monkeypatch):
+    monkeypatch.setattr(settings, "message_rate", 0.1)
+    monkeypatch.setattr(settings, "message_burst", 2)
+    monkeypatch.setattr(settings, "rate_limit_policy", "close")
+    with client.websocket_connect("/ws/r5/teacher/t1") as teacher:
+        teacher.receive_json()
+        with client.websocket_connect("/ws/r5/student/s1") as student:
+            teacher.receive_json()
+            for event in ("engaged", "drowsy", "alert"):
+                student.send_json({"type": event})
+            assert teacher.receive_json()["type"] == "engaged"
+            assert teacher.receive_json()["type"] == "drowsy"
+            with pytest.raises(WebSocketDisconnect) as closed:
+                student.receive_json()
+            assert closed.value.code == 1008
+        assert teacher.receive_json()["type"] == "student_left"
+
+
+def test_rate_limit_coalesces_to_latest(client, monkeypatch):
+    monkeypatch.setattr(settings, "message_rate", 20)
+    monkeypatch.setattr(settings, "message_burst", 1)
+    monkeypatch.setattr(settings, "rate_limit_policy", "coalesce")
+    with client.websocket_connect("/ws/r6/teacher/t1") as teacher:
+        teacher.receive_json()
+        with client.websocket_connect("/ws/r6/student/s1") as student:
+            teacher.receive_json()
+            for event in ("engaged", "drowsy", "looking_away", "alert"):
+                student.send_json({"type": event})
+            assert teacher.receive_json()["type"] == "engaged"
+            assert teacher.receive_json()["type"] == "alert"
+
+
+def test_oversized_frames_are_dropped(client, monkeypatch):
+    monkeypatch.setattr(settings, "max_frame_bytes", 64)
+    dropped = OVERSIZED_FRAMES.samples().get(("dropped",), 0)
+    with client.websocket_connect("/ws/r7/student/s1") as student:
+        student.send_json({"type": "engaged", "padding": "x" * 100})
+        # 38 characters but 68 bytes: frames are measured in bytes
+        student.send_text('{"type":"' + "é" * 30 + '"}')
+        student.send_json({"type": "ping"})
+        assert student.receive_json() == {"type": "pong"}
+    assert 'lf_oversized_frames_total{action="dropped"}' in client.get("/metrics").text
+    assert OVERSIZED_FRAMES.samples()[("dropped",)] == dropped + 2
+
+
+def test_room_capacity_rejects_joins(client, monkeypatch):
+    monkeypatch.setattr(settings, "room_capacity", 1)
+    with client.websocket_connect("/ws/r8/student/s1") as first:
+        first.send_json({"type": "ping"})
+        assert first.receive_json() == {"type": "pong"}
+        with client.websocket_connect("/ws/r8/student/s2") as second:
+            with pytest.raises(WebSocketDisconnect) as closed:
+                second.receive_json()
+            assert closed.value.code == 1013
+        # reconnecting as the same student is not a new join
+        with client.websocket_connect("/ws/r8/student/s1") as again:
+            again.send_json({"type": "ping"})
+            assert again.receive_json() == {"type": "pong"}
+
+
+def test_room_stats_report_their_scope(client):
+    with client.websocket_connect("/ws/r9/student/s1") as student:
+        student.send_json({"type": "engaged", "score": 0.8})
+        student.send_json({"type": "ping"})
+        assert student.receive_json() == {"type": "pong"}
+
+        response = client.get("/rooms/r9/stats", params={"students": "false"}).json()
+        assert response["students_count"] == 1
+        assert "students" not in response
+        stats = response["stats"]
+        # a single worker sees the whole room
+        assert stats["scope"] == "room"
+        assert stats["students_count"] == 1
+        assert stats["labels"] == {"engaged": 1}
+
+
+def test_metrics_exposed_in_prometheus_format(client):
+    with client.websocket_connect("/ws/r3/teacher/t1") as teacher:
+        teacher.receive_json()
+        with client.websocket_connect("/ws/r3/student/s1") as student:
+            teacher.receive_json()
+            text = '{"type":"engaged","score":0.9,"note":"très"}'
+            student.send_text(text)
+            teacher.receive_json()
+            # bytes on the wire, not characters
+            assert BYTES_IN.samples()[("r3",)] == len(text.encode())
+
+            response = client.get("/metrics")
+            assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+            body = response.text
+            assert "# TYPE lf_relay_latency_seconds histogram" in body
+            assert 'lf_connections{role="teacher"} 1' in body
+            assert 'lf_connections{role="student"} 1' in body
+            assert 'lf_bytes_in_total{room="r3"}' in body
+            assert 'lf_bytes_out_total{room="r3"}' in body
+            assert 'lf_relay_latency_seconds_bucket{le="+Inf"}' in body
+
+    # per-room series go away with the room
+    assert 'room="r3"' not in client.get("/metrics").text
+
+
+def test_load_generator_reports_latency():
+    with LocalServer() as server:
+        report = asyncio.run(run_load(server.url, rooms=1, students=5, teachers=2, rate=5, duration=1, server=server))
+
+    assert report["errors"] == 0
+    assert report["received_per_sec"] > 0
+    assert report["latency_p50_ms"] is not None
+    assert report["latency_p99_ms"] >= report["latency_p50_ms"]
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed = None
+
+    async def accept(self, subprotocol=None):
+        await asyncio.sleep(0)
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=""):
+        self.closed = code
+
+
+class GatedBroker(InMemoryBroker):
+    """Holds next_student_index / remove_member until the test opens the gate, like a slow Redis."""
+
+    def __init__(self):
+        super().__init__()
+        self.index_gate = None
+        self.leave_gate = None
+
+    def release(self):
+        for gate in (self.index_gate, self.leave_gate):
+            if gate is not None:
+                gate.set()
+
+    async def next_student_index(self, room_id):
+        if self.index_gate is not None:
+            await self.index_gate.wait()
+        return await super().next_student_index(room_id)
+
+    async def remove_member(self, room_id, role):
+        if self.leave_gate is not None:
+            await self.leave_gate.wait()
+        await super().remove_member(room_id, role)
+
+
+def run_with_manager(scenario, broker):
+    """Run scenario(manager) on a fresh manager, disconnecting whatever it left behind even if it fails."""
+    async def main():
+        local = ConnectionManager(broker=broker)
+        try:
+            await scenario(local)
+        finally:
+            broker.release()
+            for websocket in list(local.registry.by_socket):
+                await local.disconnect(websocket)
+            await local.stop()
+
+    asyncio.run(main())
+
+
+def test_join_survives_the_room_closing_under_it(monkeypatch):
+    monkeypatch.setattr(settings, "analytics_db_path", "")
+    broker = GatedBroker()
+
+    async def scenario(local):
+        teacher = FakeSocket()
+        await local.connect(teacher, "r", "teacher", "t1")
+
+        broker.index_gate = asyncio.Event()
+        join = asyncio.create_task(local.connect(FakeSocket(), "r", "student", "s1"))
+        await asyncio.sleep(0)
+        # the last member leaves while the student is waiting for its index
+        await local.disconnect(teacher)
+        assert not local.registry.has_room("r")
+        assert "r" not in local.room_stats
+
+        broker.index_gate.set()
+        record = await join
+        assert record.index == 0
+        assert local.registry.has_room("r")
+        assert local.room_stats["r"].status_counts == {"active": 1}
+        assert "r" in local.session_started
+
+        await local.disconnect(record.websocket)
+        assert "r" not in local.room_stats
+
+    run_with_manager(scenario, broker)
+
+
+def test_reconnect_during_teardown_is_not_wiped(monkeypatch):
+    monkeypatch.setattr(settings, "analytics_db_path", "")
+    broker = GatedBroker()
+
+    async def scenario(local):
+        teacher = FakeSocket()
+        await local.connect(teacher, "r", "teacher", "t1")
+        old = await local.connect(FakeSocket(), "r", "student", "s1")
+
+        broker.leave_gate = asyncio.Event()
+        leave = asyncio.create_task(local.disconnect(old.websocket))
+        await asyncio.sleep(0)
+        # s1 comes back while the old connection is still being torn down
+        new = await local.connect(FakeSocket(), "r", "student", "s1")
+        broker.leave_gate.set()
+        await leave
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+        assert local.registry.user("r", "student", "s1") is new
+        assert "s1" in await broker.get_students("r")
+        assert local.room_stats["r"].status_counts == {"active": 1}
+        assert [json.loads(m)["type"] for m in teacher.sent] == ["participants_list", "student_joined", "student_joined"]
+
+    run_with_manager(scenario, broker)
+
+
+def test_concurrent_joins_respect_room_and_node_capacity(monkeypatch):
+    monkeypatch.setattr(settings, "analytics_db_path", "")
+    monkeypatch.setattr(settings, "room_capacity", 2)
+    monkeypatch.setattr(settings, "node_capacity", 3)
+
+    async def scenario(local):
+        sockets = [FakeSocket() for _ in range(3)]
+        records = await asyncio.gather(*(local.connect(ws, "r", "student", f"s{i}") for i, ws in enumerate(sockets)))
+        assert sum(record is not None for record in records) == 2
+        assert [ws.closed for ws in sockets].count(1013) == 1
+        assert (await local.broker.get_counts("r"))["student"] == 2
+
+        sockets = [FakeSocket() for _ in range(2)]
+        records = await asyncio.gather(*(local.connect(ws, f"other-{i}", "teacher", "t") for i, ws in enumerate(sockets)))
+        assert sum(record is not None for record in records) == 1
+        assert len(local.registry) == 3
+        assert local.joining == 0
+
+        for websocket in list(local.registry.by_socket):
+            await local.disconnect(websocket)
+        assert await local.broker.get_counts("r") == {"teacher": 0, "student": 0}
+
+    run_with_manager(scenario, GatedBroker())
+
+
+def test_frame_limits_through_uvicorn():
+    # frames over MAX_FRAME_BYTES follow the policy; only those over --ws-max-size are refused by uvicorn
+    async def scenario(url):
+        async with websockets.connect(f"{url}/ws/r1/student/s1") as student:
+            await student.send(json.dumps({"type": "engaged", "padding": "x" * 100}))
+            await student.send(json.dumps({"type": "ping"}))
+            assert json.loads(await student.recv()) == {"type": "pong"}
+
+            await student.send("x" * 1000)
+            with pytest.raises(websockets.ConnectionClosed) as closed:
+                await student.recv()
+            assert closed.value.rcvd.code == 1009
+
+    with LocalServer({"MAX_FRAME_BYTES": "64"}, args=["--ws-max-size", "256"]) as server:
+        asyncio.run(scenario(server.url))
+        metrics = urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics").read().decode()
+
+    assert 'lf_oversized_frames_total{action="dropped"} 1' in metrics
@@ -0,0 +1,123 @@
+"""
+Compact binary wire format ("lf.bin.v1") for the student/teacher WebSocket.
+
+Negotiated per connection with the `lf.bin.v1` subprotocol or `?encoding=binary`.
+JSON stays the default. In binary mode the hot-path messages travel as fixed
+big-endian structs with numeric student indices and epoch-ms timestamps. Rare
+control messages (participants_list, student_joined/left, teacher_message)
+still go out as JSON text frames. student_joined and participants_list carry
+each student's "index" so clients can map indices back to ids and names.
+
+Server -> client:
+  event frame     !BBBIQf  version, event code, label code (255 = none), student index, ts ms, score (NaN = none)
+  snapshot frame  !BBQBH   version, SNAPSHOT, ts ms, full (0/1), entry count
+                  followed by count x !BBIf  event code, label code, student index, score
+Client (student) -> server:
+  event frame     !BBf     version, event code, score (NaN = none)
+"""
+import math
+import struct
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import WebSocket
+
+from app.services.processor import LABELS
+
+SUBPROTOCOL = "lf.bin.v1"
+VERSION = 1
+
+EVENT_TYPES = ("drowsy", "looking_away", "distracted", "engaged", "alert", "feedback")
+EVENT_CODES = {name: i + 1 for i, name in enumerate(EVENT_TYPES)}
+LABEL_CODES = {label: i for i, label in enumerate(LABELS)}
+NO_LABEL = 255
+SNAPSHOT = 0x80
+
+EVENT_FRAME = struct.Struct("!BBBIQf")
+SNAPSHOT_HEADER = struct.Struct("!BBQBH")
+SNAPSHOT_ENTRY = struct.Struct("!BBIf")
+STUDENT_FRAME = struct.Struct("!BBf")
+
+NAN = float("nan")
+
+
+def negotiate(websocket: WebSocket) -> Tuple[str, Optional[str]]:
+    """
+    Pick the encoding for a connection. Returns (encoding, subprotocol to accept with).
+    """
+    if SUBPROTOCOL in websocket.scope.get("subprotocols", []):
+        return "binary", SUBPROTOCOL
+    if websocket.query_params.get("encoding") == "binary":
+        return "binary", None
+    return "json", None
+
+
+def epoch_ms(message: Dict[str, Any]) -> int:
+    """The message's epoch-ms `ts`; ISO `timestamp`s are only parsed for messages stamped elsewhere."""
+    ts = message.get("ts")
+    if isinstance(ts, int):
+        return ts
+    timestamp = message.get("timestamp")
+    if timestamp:
+        try:
+            return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+        except (TypeError, ValueError):
+            pass
+    return int(time.time() * 1000)
+
+
+def _score(value: Any) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return NAN
+
+
+def _event_fields(message: Dict[str, Any], index_of: Callable[[str], Optional[int]]) -> Optional[Tuple[int, int, int, float]]:
+    code = EVENT_CODES.get(message.get("type"))
+    index = index_of(message.get("student_id"))
+    if code is None or index is None:
+        return None
+
+    if code == EVENT_CODES["feedback"]:
+        feedback = message.get("feedback") or {}
+        derived = message.get("derived") or {}
+        label = LABEL_CODES.get(derived.get("label") or feedback.get("label"), NO_LABEL)
+        return code, label, index, _score(feedback.get("score"))
+
+    return code, NO_LABEL, index, _score(message.get("score"))
+
+
+def encode_binary(message: Dict[str, Any], index_of: Callable[[str], Optional[int]]) -> Optional[bytes]:
+    """
+    Encode a server -> client message. Returns None when the message has no
+    binary form (control messages), in which case it should be sent as JSON.
+    """
+    if message.get("type") == "room_snapshot":
+        entries = []
+        for state in message.get("students", []):
+            fields = _event_fields(state, index_of)
+            if fields is not None:
+                entries.append(SNAPSHOT_ENTRY.pack(*fields))
+        header = SNAPSHOT_HEADER.pack(VERSION, SNAPSHOT, epoch_ms(message), bool(message.get("full")), len(entries))
+        return header + b"".join(entries)
+
+    fields = _event_fields(message, index_of)
+    if fields is None:
+        return None
+    code, label, index, score = fields
+    return EVENT_FRAME.pack(VERSION, code, label, index, epoch_ms(message), score)
+
+
+def decode_student_frame(data: bytes) -> Dict[str, Any]:
+    """Decode a student event frame into the same dict shape as a JSON message."""
+    if len(data) != STUDENT_FRAME.size:
+        raise ValueError(f"Bad frame size {len(data)}")
+    version, code, score = STUDENT_FRAME.unpack(data)
+    if version != VERSION or not 1 <= code <= len(EVENT_TYPES):
+        raise ValueError(f"Unsupported frame version {version} / type {code}")
+
+    message: Dict[str, Any] = {"type": EVENT_TYPES[code - 1]}
+    if not math.isnan(score):
+        message["score"] = score
+    return message
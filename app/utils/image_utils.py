@@ -0,0 +1,38 @@
+from typing import Optional, Union
+
+import numpy as np
+
+JPEG_SOI = b"\xff\xd8\xff"
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def require_cv2():
+    try:
+        import cv2
+    except ImportError as e:
+        raise RuntimeError("Frame decoding needs OpenCV (opencv-python-headless) installed") from e
+    return cv2
+
+
+def is_jpeg(data: Buffer) -> bool:
+    return bytes(data[:3]) == JPEG_SOI
+
+
+def decode_jpeg(data: Buffer, max_side: int = 0) -> Optional[np.ndarray]:
+    """
+    Decode a JPEG into a BGR image. The encoded bytes are wrapped with
+    np.frombuffer (no copy) and handed straight to cv2.imdecode.
+    Frames larger than `max_side` on their longest edge are downscaled.
+    Returns None for undecodable data.
+    """
+    cv2 = require_cv2()
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+
+    h, w = image.shape[:2]
+    if max_side and max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        image = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    return image
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Optional, Tuple, Union
+
+from fastapi import WebSocket
+
+from app.core.metrics import SEND_FAILURES
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop-oldest", "coalesce", "disconnect")
+
+# 1013 "Try Again Later": used when a slow consumer is cut off or a send times out.
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# 1011 "Internal Error": a send failed outright.
+SEND_ERROR_CLOSE_CODE = 1011
+
+
+def iso_timestamp(ts: int) -> str:
+    return datetime.fromtimestamp(ts / 1000).isoformat()
+
+
+def with_timestamps(message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Events are stamped once with epoch-ms `ts` when received (which is all
+    binary peers need); JSON peers also get the ISO `timestamp`, formatted
+    here once per fan-out, including for each student in a room_snapshot.
+    """
+    if "ts" in message and "timestamp" not in message:
+        message = {**message, "timestamp": iso_timestamp(message["ts"])}
+    if message.get("type") == "room_snapshot":
+        message = {**message, "students": [with_timestamps(state) for state in message.get("students", [])]}
+    return message
+
+
+def encode_message(message: Any) -> str:
+    """
+    Serialize a message exactly once so it can be shared by every recipient.
+    Uses the same compact separators as Starlette's send_json.
+    """
+    return json.dumps(message, separators=(",", ":"))
+
+
+def payload_size(payload: Union[str, bytes]) -> int:
+    """Bytes on the wire. Text is counted as UTF-8; isascii() is O(1), so plain ASCII JSON is not re-encoded."""
+    if isinstance(payload, bytes) or payload.isascii():
+        return len(payload)
+    return len(payload.encode())
+
+
+class OutboundChannel:
+    """
+    Bounded outbound queue for a single WebSocket, drained by its own writer task.
+
+    Producers call `send()` which never awaits, so a slow peer can only ever
+    fill its own queue. When the queue is full the overflow policy applies:
+    - drop-oldest: discard the oldest queued payload
+    - coalesce: replace the queued payload with the same key (falls back to drop-oldest)
+    - disconnect: close the socket with 1013 and stop accepting payloads
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        maxsize: int = 256,
+        policy: str = "drop-oldest",
+        send_timeout: float = 10.0,
+        encoding: str = "json",
+    ):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.websocket = websocket
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.encoding = encoding
+        self.closed = False
+        self.dropped = 0
+        self._queue: Deque[Tuple[Optional[str], Union[str, bytes]]] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._writer())
+
+    def __len__(self):
+        return len(self._queue)
+
+    def send(self, payload: Union[str, bytes], key: Optional[str] = None) -> bool:
+        """
+        Queue an already-encoded payload (str -> text frame, bytes -> binary frame).
+        Returns False if the channel is closed (or was just closed by the
+        disconnect policy).
+        """
+        if self.closed:
+            SEND_FAILURES.inc("closed")
+            return False
+
+        if len(self._queue) >= self.maxsize and not self._overflow(key):
+            return False
+
+        self._queue.append((key, payload))
+        self._wakeup.set()
+        return True
+
+    def _overflow(self, key: Optional[str]) -> bool:
+        self.dropped += 1
+
+        if self.policy == "disconnect":
+            SEND_FAILURES.inc("slow_consumer")
+            logger.warning(f"Disconnecting slow consumer ({len(self._queue)} queued)")
+            self.close()
+            asyncio.create_task(self._close_socket(SLOW_CONSUMER_CLOSE_CODE, "slow consumer"))
+            return False
+
+        if self.policy == "coalesce" and key is not None:
+            for i, (queued_key, _) in enumerate(self._queue):
+                if queued_key == key:
+                    del self._queue[i]
+                    SEND_FAILURES.inc("coalesced")
+                    return True
+
+        self._queue.popleft()
+        SEND_FAILURES.inc("dropped")
+        return True
+
+    async def _writer(self):
+        try:
+            # checking `closed` as well as relying on cancel(): wait_for() can
+            # swallow a cancellation that races with a completed send
+            while not self.closed:
+                if not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                _, payload = self._queue.popleft()
+                if isinstance(payload, bytes):
+                    await asyncio.wait_for(self.websocket.send_bytes(payload), self.send_timeout)
+                else:
+                    await asyncio.wait_for(self.websocket.send_text(payload), self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            SEND_FAILURES.inc("timeout")
+            logger.error(f"Timed out sending to connection after {self.send_timeout}s")
+            self.close()
+            # closing the socket ends the endpoint's receive loop, which tears the connection down
+            await self._close_socket(SLOW_CONSUMER_CLOSE_CODE, "send timed out")
+        except Exception as e:
+            SEND_FAILURES.inc("error")
+            logger.error(f"Error sending to connection: {e}")
+            self.close()
+            await self._close_socket(SEND_ERROR_CLOSE_CODE, "send failed")
+
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            # a peer that stopped reading may not take the close frame either
+            await asyncio.wait_for(self.websocket.close(code=code, reason=reason), self.send_timeout)
+        except Exception:
+            pass
+
+    def close(self):
+        """Stop the writer and drop anything still queued. Safe to call twice."""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()